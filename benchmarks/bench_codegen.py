@@ -0,0 +1,105 @@
+# benchmarks/bench_codegen.py
+"""
+Time generate_document_code on synthetic documents with many functions,
+next to the string-replace pipeline it replaced (legacy_generate_document_code)
+and to the same rewriter tokenizing every body with tokenize, as it did before
+the regular-expression scanner.
+
+    python benchmarks/bench_codegen.py 1000 5000
+"""
+import sys
+import textwrap
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from language import rewriter
+from language.ast import FunctionDefinition
+from language.code_generator import extract_imports, generate_document_code
+from language.rewriter import clean_body
+
+BODY = '''import json
+import os
+data = {{"index": {n}, "cwd": os.getcwd()}}
+previous = function_{prev}() if {n} > 1 else None
+text = json.dumps(data) + " uses os. and function_{prev}() in a string"
+return previous, text
+'''
+
+
+def synthetic_functions(count):
+    return [
+        FunctionDefinition(
+            name=f"function_{n}",
+            instructions=f"store item {n} and refer to function_{max(n - 1, 1)}",
+            generated_code=BODY.format(n=n, prev=max(n - 1, 1)),
+        )
+        for n in range(1, count + 1)
+    ]
+
+
+def legacy_generate_document_code(functions):
+    """
+    A copy of the function-body part of generate_document_code before the
+    token-based rewriter: line-based import removal, then one str.replace per
+    module and four per earlier function, for every function.
+    """
+    all_imports = set()
+    for func in functions:
+        all_imports.update(extract_imports(func.generated_code))
+    code_lines = [f"module_manager.load_module('{module}')" for module in sorted(all_imports)]
+    for i, func in enumerate(functions):
+        func_body = clean_body(func.generated_code)
+        func_body = "\n".join(
+            line for line in func_body.split("\n")
+            if not line.strip().startswith("import") and not line.strip().startswith("from")
+        )
+        for module in all_imports:
+            func_body = func_body.replace(f"{module}.", f"global_env['{module}'].")
+        for j, _ in enumerate(functions):
+            if j >= i:
+                continue
+            func_body = func_body.replace(f"function_{j+1}()", f"global_env['function_{j+1}']")
+            func_body = func_body.replace("previous_function()", f"global_env['function_{i}']")
+            func_body = func_body.replace(f"function {j+1}", f"global_env['function_{j+1}']")
+            func_body = func_body.replace("function before this one", f"global_env['function_{i}']")
+        func_body = textwrap.indent(textwrap.dedent(func_body), "    ")
+        code_lines.append(f"def {func.name}():\n    global global_env\n{func_body}\n")
+    return "\n".join(code_lines)
+
+
+def tokenize_generate_document_code(functions):
+    """generate_document_code with the scanner disabled, so every body goes through tokenize."""
+    scan = rewriter._scan
+    rewriter._scan = lambda source: None
+    try:
+        return generate_document_code(functions)
+    finally:
+        rewriter._scan = scan
+
+
+def best_of(repeat, generate, functions):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        code = generate(functions)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, code
+
+
+def main(sizes, repeat=3):
+    print(f"Python {sys.version.split()[0]}, best of {repeat}")
+    for count in sizes:
+        functions = synthetic_functions(count)
+        legacy, _ = best_of(repeat, legacy_generate_document_code, functions)
+        tokenized, _ = best_of(repeat, tokenize_generate_document_code, functions)
+        elapsed, code = best_of(repeat, generate_document_code, functions)
+        compile(code, "<bench>", "exec")
+        print(f"{count:>6} functions: legacy {legacy * 1000:8.1f} ms  tokenize {tokenized * 1000:8.1f} ms"
+              f"  scanner {elapsed * 1000:8.1f} ms  ({len(code)} chars)")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [10, 100, 1000, 5000])
@@ -0,0 +1,83 @@
+# benchmarks/fake_llm.py
+"""
+A deterministic local stand-in for the OpenAI client. It answers the prompts
+language/parser.py sends with canned code, after a configurable delay, so the
+pipeline can be timed without network access or an API key.
+
+    from language.parser import set_client
+    set_client(FakeLLMClient(latency=0.05))
+"""
+import json
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+SINGLE_MARKER = "produce the Python code for the function:"
+BATCH_MARKER = "produce the Python code for each of these functions:"
+BATCH_ENTRY = re.compile(r"^### (function_\d+)\n(.*?)(?=^### |\Z)", re.MULTILINE | re.DOTALL)
+ITEM = re.compile(r"\bitem (\d+)")
+REFERENCE = re.compile(r"\bfunction_(\d+)\b")
+
+
+def canned_code(instructions):
+    """
+    Code for the instructions synthetic.py writes: "store item N" returns a
+    number, and "add item N to function_M" builds on function_M's result.
+    Anything else gets a body that just returns None.
+    """
+    item = ITEM.search(instructions)
+    if item is None:
+        return "return None"
+    n = int(item.group(1))
+    reference = REFERENCE.search(instructions)
+    if reference is None:
+        return f"import math\nvalue = math.isqrt({n} * {n})\nreturn value"
+    return f"import json\nprevious = function_{reference.group(1)}()\nreturn json.loads(json.dumps(previous + {n}))"
+
+
+class FakeLLMClient:
+    """
+    Mimics client.chat.completions.create. Each request sleeps for latency
+    seconds plus per_token_latency per estimated completion token. outputs
+    maps instruction text to the code to return, overriding canned_code.
+    """
+
+    def __init__(self, latency=0.0, per_token_latency=0.0, outputs=None):
+        self.latency = latency
+        self.per_token_latency = per_token_latency
+        self.outputs = outputs or {}
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def code_for(self, instructions):
+        instructions = instructions.strip()
+        return self.outputs.get(instructions, canned_code(instructions))
+
+    def respond(self, prompt):
+        if BATCH_MARKER in prompt:
+            listing = prompt.split(BATCH_MARKER, 1)[1].split("\nRespond with only", 1)[0]
+            return json.dumps({
+                name: self.code_for(instructions)
+                for name, instructions in BATCH_ENTRY.findall(listing.strip())
+            })
+        if SINGLE_MARKER in prompt:
+            return self.code_for(prompt.split(SINGLE_MARKER, 1)[1])
+        return "No suggestion: the benchmark backend does not debug."
+
+    def create(self, model, messages, temperature=None, **kwargs):
+        prompt = messages[-1]["content"]
+        text = self.respond(prompt)
+        prompt_tokens, completion_tokens = len(prompt) // 4 + 1, len(text) // 4 + 1
+        with self._lock:
+            self.requests += 1
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+        time.sleep(self.latency + self.per_token_latency * completion_tokens)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=text))],
+            usage=SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens),
+        )
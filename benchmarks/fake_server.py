@@ -0,0 +1,99 @@
+# benchmarks/fake_server.py
+"""
+An OpenAI-compatible chat completions server backed by FakeLLMClient, for
+exercising the real HTTP client, rate limiting and retries locally.
+
+    python benchmarks/fake_server.py --port 8001 --rate-limit-every 10
+    NATURE_LLM_BASE_URL=http://127.0.0.1:8001/v1 python -m language.repl examples/demo.nature
+"""
+import argparse
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from fake_llm import FakeLLMClient
+
+
+def make_handler(fake, rate_limit_every=0, retry_after=0):
+    counter = itertools.count(1)
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status, payload, headers=()):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in headers:
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if not self.path.endswith("/chat/completions"):
+                self._send(404, {"error": {"message": f"unknown path {self.path}"}})
+                return
+            with lock:
+                number = next(counter)
+            if rate_limit_every and number % rate_limit_every == 0:
+                self._send(429, {"error": {"message": "rate limited", "type": "rate_limit_error"}},
+                           [("Retry-After", str(retry_after))])
+                return
+            response = fake.create(request.get("model"), request.get("messages", []), request.get("temperature"))
+            self._send(200, {
+                "id": f"chatcmpl-{number}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get("model"),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": response.choices[0].message.content},
+                    "finish_reason": "stop",
+                }],
+                "usage": {
+                    "prompt_tokens": response.usage.prompt_tokens,
+                    "completion_tokens": response.usage.completion_tokens,
+                    "total_tokens": response.usage.prompt_tokens + response.usage.completion_tokens,
+                },
+            })
+
+    return Handler
+
+
+def serve(host="127.0.0.1", port=8001, latency=0.0, rate_limit_every=0, retry_after=0):
+    """Start the server on a background thread and return it; call shutdown() to stop."""
+    fake = FakeLLMClient(latency=latency)
+    server = ThreadingHTTPServer((host, port), make_handler(fake, rate_limit_every, retry_after))
+    server.daemon_threads = True
+    server.fake = fake
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve FakeLLMClient over an OpenAI-compatible HTTP API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds each request takes")
+    parser.add_argument("--rate-limit-every", type=int, default=0, help="answer every Nth request with a 429")
+    parser.add_argument("--retry-after", type=float, default=0, help="Retry-After seconds sent with each 429")
+    args = parser.parse_args()
+    server = serve(args.host, args.port, args.latency, args.rate_limit_every, args.retry_after)
+    print(f"Fake LLM server on http://{args.host}:{server.server_address[1]}/v1")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
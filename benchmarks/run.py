@@ -0,0 +1,194 @@
+# benchmarks/run.py
+"""
+Run the whole compile/run pipeline on synthetic documents against the fake
+LLM backend and record timings as JSON.
+
+    python benchmarks/run.py                        # 1, 10, 100, 1000 functions
+    python benchmarks/run.py --sizes 1 100 10000 --latency 0.05
+    python benchmarks/run.py --compare benchmarks/results/<commit>.json
+
+Results are written to benchmarks/results/<commit>.json unless --output is
+given. --compare prints each metric against an earlier results file and
+exits non-zero when any slowed down by more than --threshold.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+# Keep runs independent of each other and of the user's cache.
+os.environ["NATURE_NO_CACHE"] = "1"
+
+from fake_llm import FakeLLMClient
+from synthetic import synthetic_document
+from language.code_generator import generate_document_code
+from language.backends import OpenAIBackend, set_backend
+from language.parser import generate_functions
+from language.templates import template_cache
+from language.utils import parse_nature_document
+
+DEFAULT_SIZES = [1, 10, 100, 1000]
+# Lower is better for every metric except these.
+HIGHER_IS_BETTER = {"generate_functions_per_s"}
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_pipeline(text, max_in_flight, batch_size, templates=False):
+    """Parse, generate, codegen and run one document; returns (timings, program output)."""
+    template_cache.clear()
+    timings = {}
+    started = time.perf_counter()
+    functions = parse_nature_document(text)
+    timings["parse_s"] = time.perf_counter() - started
+
+    mark = time.perf_counter()
+    # The on-disk cache is disabled above, so use_cache only turns the in-memory template cache on.
+    generate_functions(functions, max_in_flight=max_in_flight, use_cache=templates, batch_size=batch_size)
+    timings["generate_s"] = time.perf_counter() - mark
+    timings["template_hits"] = template_cache.hits
+
+    mark = time.perf_counter()
+    full_code = generate_document_code(functions)
+    timings["codegen_s"] = time.perf_counter() - mark
+
+    mark = time.perf_counter()
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        exec(compile(full_code, "<benchmark>", "exec"), {"__name__": "__main__"})
+    timings["run_s"] = time.perf_counter() - mark
+    timings["total_s"] = time.perf_counter() - started
+    return timings, output.getvalue()
+
+
+def benchmark(count, args):
+    text = synthetic_document(count)
+    if args.base_url:
+        # Go through the real HTTP client against a server such as fake_server.py.
+        backend = OpenAIBackend(base_url=args.base_url)
+        backend.client  # create the client before timing anything
+    else:
+        fake = FakeLLMClient(latency=args.latency, per_token_latency=args.per_token_latency)
+        backend = OpenAIBackend(client=fake)
+    set_backend(backend)
+    runs = [run_pipeline(text, args.max_in_flight, args.batch_size, args.templates) for _ in range(args.repeat)]
+    # Median of each stage over the repeats.
+    result = {"functions": count}
+    for metric in runs[0][0]:
+        values = sorted(timings[metric] for timings, _ in runs)
+        result[metric] = values[len(values) // 2]
+    result["generate_functions_per_s"] = count / result["generate_s"] if result["generate_s"] else None
+    result["llm_requests"] = backend.stats["requests"] // args.repeat
+    result["llm_retries"] = backend.stats["retries"] // args.repeat
+    output = runs[-1][1]
+
+    # Peak memory is measured on a separate pass since tracing slows everything down.
+    result["peak_memory_bytes"] = None
+    if args.memory:
+        tracemalloc.start()
+        run_pipeline(text, args.max_in_flight, args.batch_size, args.templates)
+        result["peak_memory_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    result["errors"] = output.count("Error in function_")
+    return result
+
+
+def compare(results, baseline, threshold):
+    """Print each metric relative to baseline; return True if any regressed past threshold."""
+    previous = {row["functions"]: row for row in baseline["results"]}
+    regressed = False
+    print(f"\nCompared with {baseline.get('commit', '?')} (threshold {threshold:.2f}x):")
+    for row in results:
+        old = previous.get(row["functions"])
+        if old is None:
+            continue
+        for metric, value in row.items():
+            if metric in ("functions", "errors", "llm_requests", "llm_retries", "template_hits") or not value or not old.get(metric):
+                continue
+            ratio = value / old[metric]
+            slower = 1 / ratio if metric in HIGHER_IS_BETTER else ratio
+            flag = "  REGRESSION" if slower > threshold else ""
+            regressed = regressed or bool(flag)
+            print(f"  {row['functions']:>6} {metric:<26} {old[metric]:>14.4f} -> {value:>14.4f} ({ratio:.2f}x){flag}")
+    return regressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Nature pipeline against a fake LLM backend.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="functions per document")
+    parser.add_argument("--latency", type=float, default=0.01, help="seconds the fake model takes per request")
+    parser.add_argument("--per-token-latency", type=float, default=0.0, help="extra seconds per completion token")
+    parser.add_argument("--max-in-flight", type=int, default=None, help="concurrent generation requests")
+    parser.add_argument("--batch-size", type=int, default=None, help="functions per generation request")
+    parser.add_argument("--base-url", help="benchmark against an OpenAI-compatible server instead of the in-process fake")
+    parser.add_argument("--templates", action="store_true", help="enable the template cache for near-duplicate instructions")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per size (the median is reported)")
+    parser.add_argument("--no-memory", dest="memory", action="store_false",
+                        help="skip the (slow) traced pass that measures peak memory")
+    parser.add_argument("--output", help="results file (default benchmarks/results/<commit>.json)")
+    parser.add_argument("--compare", metavar="BASELINE", help="results file from an earlier commit to compare against")
+    parser.add_argument("--threshold", type=float, default=1.2, help="slowdown ratio reported as a regression")
+    args = parser.parse_args(argv)
+
+    commit = current_commit()
+    results = []
+    for count in args.sizes:
+        row = benchmark(count, args)
+        results.append(row)
+        print(
+            f"{count:>6} functions: parse {row['parse_s'] * 1000:8.1f} ms  generate {row['generate_s'] * 1000:9.1f} ms "
+            f"({row['generate_functions_per_s']:8.1f}/s)  codegen {row['codegen_s'] * 1000:8.1f} ms  "
+            f"run {row['run_s'] * 1000:8.1f} ms  total {row['total_s'] * 1000:9.1f} ms"
+            + (f"  peak {row['peak_memory_bytes'] / 2**20:6.1f} MiB" if row["peak_memory_bytes"] else "")
+        )
+
+    report = {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {
+            "base_url": args.base_url,
+            "latency": args.latency,
+            "per_token_latency": args.per_token_latency,
+            "max_in_flight": args.max_in_flight,
+            "batch_size": args.batch_size,
+            "templates": args.templates,
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    output = Path(args.output) if args.output else ROOT / "benchmarks" / "results" / f"{commit}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2) + "\n")
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
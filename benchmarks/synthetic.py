@@ -0,0 +1,23 @@
+# benchmarks/synthetic.py
+"""Synthetic .nature documents whose instructions fake_llm.py knows how to answer."""
+
+
+def synthetic_document(count, chain_every=4):
+    """
+    A document with count functions. Every chain_every-th function builds on
+    the one before it, the rest are independent, so the runtime has both
+    dependencies and parallel work to schedule.
+    """
+    blocks = []
+    for n in range(1, count + 1):
+        if n > 1 and chain_every and n % chain_every == 0:
+            blocks.append(f"function:\n    add item {n} to the result of function_{n - 1}\n    return the total\n")
+        else:
+            blocks.append(f"function:\n    store item {n}\n    return it\n")
+    return "".join(blocks)
+
+
+def write_synthetic_document(path, count, chain_every=4):
+    with open(path, "w") as f:
+        f.write(synthetic_document(count, chain_every))
+    return path
@@ -0,0 +1,94 @@
+# language/artifact.py
+import hashlib
+import importlib.util
+import marshal
+import os
+from pathlib import Path
+from . import config
+from .profiler import span
+
+ARTIFACT_MAGIC = b"NATC"
+ARTIFACT_VERSION = 4
+ARTIFACT_SUFFIX = ".naturec"
+
+
+def artifact_path(source_path):
+    """The compiled artifact lives next to its source: demo.nature -> demo.naturec."""
+    return Path(source_path).with_suffix(ARTIFACT_SUFFIX)
+
+
+def source_hash(source_path):
+    with open(source_path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def write_artifact(source_path, full_code, functions, model=None):
+    """
+    Compile full_code and store it, together with the data needed to check it
+    is still valid, as a marshalled artifact next to source_path. Returns the
+    compiled code object.
+    """
+    from .incremental import instruction_hash
+
+    with span("compile", "exec"):
+        code = compile(full_code, str(source_path), "exec")
+    payload = {
+        "version": ARTIFACT_VERSION,
+        "python": importlib.util.MAGIC_NUMBER,
+        "model": model or config.MODEL,
+        "source_hash": source_hash(source_path),
+        "functions": [
+            (func.name, func.instructions, func.generated_code, instruction_hash(func.instructions),
+             (func.start_line, func.end_line, func.start_byte, func.end_byte))
+            for func in functions
+        ],
+        "source": full_code,
+        "code": code,
+    }
+    path = artifact_path(source_path)
+    tmp_path = path.with_suffix(ARTIFACT_SUFFIX + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(ARTIFACT_MAGIC)
+        marshal.dump(payload, f)
+    os.replace(tmp_path, path)
+    return code
+
+
+def load_artifact(source_path, model=None):
+    """
+    Return the artifact payload for source_path if one exists and is still
+    valid for the current source, model and Python version; otherwise None.
+    """
+    path = artifact_path(source_path)
+    try:
+        with open(path, "rb") as f:
+            if f.read(len(ARTIFACT_MAGIC)) != ARTIFACT_MAGIC:
+                return None
+            payload = marshal.load(f)
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+
+    if not isinstance(payload, dict):
+        return None
+    if payload.get("version") != ARTIFACT_VERSION:
+        return None
+    if payload.get("python") != importlib.util.MAGIC_NUMBER:
+        return None
+    if payload.get("model") != (model or config.MODEL):
+        return None
+    try:
+        if payload.get("source_hash") != source_hash(source_path):
+            return None
+    except OSError:
+        return None
+    return payload
+
+
+def artifact_functions(payload):
+    """Rebuild the FunctionDefinitions recorded in an artifact."""
+    from .ast import FunctionDefinition
+
+    return [
+        FunctionDefinition(name, instructions, code, *span)
+        for name, instructions, code, _, span in payload["functions"]
+    ]
@@ -1,5 +1,6 @@
 # nature/ast.py
 from dataclasses import dataclass
+from typing import Optional
 
 @dataclass
 class FunctionDefinition:
@@ -7,6 +8,18 @@ class FunctionDefinition:
     name: str                  # Function name (e.g., function_1)
     instructions: str          # The natural language instructions
     generated_code: str        # Python code generated from the instructions
+    start_line: Optional[int] = None   # 1-based line of the "function:" header
+    end_line: Optional[int] = None     # 1-based last line with instructions
+    start_byte: Optional[int] = None   # Byte offset of the "function:" header
+    end_byte: Optional[int] = None     # Byte offset just past the last instruction line
 
     def __repr__(self):
         return f"FunctionDefinition(name='{self.name}', instructions='''{self.instructions}''')"
+
+    def location(self):
+        """Human-readable source span, e.g. 'lines 4-7'."""
+        if self.start_line is None:
+            return None
+        if self.end_line is None or self.end_line == self.start_line:
+            return f"line {self.start_line}"
+        return f"lines {self.start_line}-{self.end_line}"
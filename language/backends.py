@@ -0,0 +1,269 @@
+# language/backends.py
+import os
+import random
+import threading
+import time
+from collections import namedtuple
+from . import config
+
+try:
+    import httpx
+except ImportError:  # the OpenAI client falls back to its own connection pool
+    httpx = None
+
+# Text of a model response plus the token usage the server reported (None if it didn't).
+Completion = namedtuple("Completion", ["text", "prompt_tokens", "completion_tokens"])
+
+
+def estimate_tokens(text):
+    """Rough token count (about four characters per token)."""
+    return len(text) // 4 + 1
+
+
+class TokenBucket:
+    """
+    Allows up to per_minute units a minute, refilled continuously, with bursts
+    up to a full minute's worth. A rate of 0 means unlimited.
+    """
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.tokens = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount=1):
+        """Block until amount units are available, then take them."""
+        if not self.capacity:
+            return
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def consume(self, amount):
+        """Take amount units without waiting; the balance may go negative."""
+        if not self.capacity:
+            return
+        with self._lock:
+            self._refill()
+            self.tokens -= amount
+
+
+class AdaptiveLimiter:
+    """
+    A semaphore whose limit follows additive-increase/multiplicative-decrease:
+    every rate-limited response halves the number of concurrent requests, and
+    each success grows it again by about one per limit's worth of successes,
+    up to maximum.
+    """
+
+    def __init__(self, maximum):
+        self.maximum = max(1, maximum)
+        self.limit = float(self.maximum)
+        self.active = 0
+        self._condition = threading.Condition()
+
+    def __enter__(self):
+        with self._condition:
+            while self.active >= int(self.limit):
+                self._condition.wait()
+            self.active += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        with self._condition:
+            self.active -= 1
+            self._condition.notify_all()
+
+    def on_success(self):
+        with self._condition:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+    def on_rate_limited(self):
+        with self._condition:
+            self.limit = max(1.0, self.limit / 2)
+
+
+def _status_code(error):
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status
+
+
+def is_rate_limited(error):
+    return _status_code(error) == 429 or type(error).__name__ == "RateLimitError"
+
+
+def is_retryable(error):
+    """Rate limits, server errors, timeouts and dropped connections are worth retrying."""
+    if is_rate_limited(error):
+        return True
+    status = _status_code(error)
+    if status is not None:
+        return status >= 500 or status == 408
+    return type(error).__name__ in ("APIConnectionError", "APITimeoutError", "ConnectionError", "TimeoutError")
+
+
+def retry_after(error):
+    """Seconds the server asked us to wait, from a Retry-After header, if any."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class LLMBackend:
+    """
+    Interface to a chat model. Subclasses implement _request; complete adds
+    rate limiting, adaptive concurrency and retries around it, so a backend
+    instance should be shared by everything that talks to the same endpoint.
+    """
+
+    def __init__(self, model=None, max_concurrency=None, requests_per_minute=None,
+                 tokens_per_minute=None, max_retries=None, backoff_base=None, backoff_max=None):
+        self.model = model or config.MODEL
+        self.max_retries = config.LLM_MAX_RETRIES if max_retries is None else max_retries
+        self.backoff_base = config.LLM_BACKOFF_BASE if backoff_base is None else backoff_base
+        self.backoff_max = config.LLM_BACKOFF_MAX if backoff_max is None else backoff_max
+        self.requests = TokenBucket(config.LLM_REQUESTS_PER_MINUTE if requests_per_minute is None else requests_per_minute)
+        self.tokens = TokenBucket(config.LLM_TOKENS_PER_MINUTE if tokens_per_minute is None else tokens_per_minute)
+        self.concurrency = AdaptiveLimiter(max_concurrency or config.MAX_IN_FLIGHT)
+        self.stats = {"requests": 0, "retries": 0, "rate_limited": 0}
+        self._stats_lock = threading.Lock()
+
+    def _request(self, prompt, temperature):
+        """Send one request and return a Completion. Errors propagate."""
+        raise NotImplementedError
+
+    def _count(self, name):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def backoff(self, attempt, error):
+        """Exponential backoff with full jitter, or the server's Retry-After when it gave one."""
+        delay = retry_after(error)
+        if delay is None:
+            delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        return delay
+
+    def complete(self, prompt, temperature, info=None):
+        """
+        Send prompt and return a Completion, retrying rate-limited and transient
+        failures. info, if given, receives token usage and the retry count.
+        """
+        prompt_tokens = estimate_tokens(prompt)
+        attempt = 0
+        while True:
+            self.requests.acquire()
+            self.tokens.acquire(prompt_tokens)
+            try:
+                with self.concurrency:
+                    self._count("requests")
+                    completion = self._request(prompt, temperature)
+            except Exception as e:
+                if is_rate_limited(e):
+                    self._count("rate_limited")
+                    self.concurrency.on_rate_limited()
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                self._count("retries")
+                time.sleep(self.backoff(attempt, e))
+                attempt += 1
+                continue
+            self.concurrency.on_success()
+            self.tokens.consume(completion.completion_tokens or estimate_tokens(completion.text))
+            if info is not None:
+                info["prompt_tokens"] = completion.prompt_tokens
+                info["completion_tokens"] = completion.completion_tokens
+                if attempt:
+                    info["retries"] = attempt
+            return completion
+
+
+class OpenAIBackend(LLMBackend):
+    """
+    Chat completions through the OpenAI client, or any OpenAI-compatible server
+    when base_url is set. One client, and so one HTTP connection pool, is
+    shared by every request. An existing client object may be passed in.
+    """
+
+    def __init__(self, client=None, base_url=None, api_key=None, timeout=None, **kwargs):
+        super().__init__(**kwargs)
+        self.base_url = base_url or config.LLM_BASE_URL
+        self.api_key = api_key
+        self.timeout = config.LLM_TIMEOUT if timeout is None else timeout
+        self._client = client
+        self._client_lock = threading.Lock()
+
+    @property
+    def client(self):
+        with self._client_lock:
+            if self._client is None:
+                self._client = self._create_client()
+        return self._client
+
+    def _create_client(self):
+        from openai import OpenAI
+
+        api_key = self.api_key or os.environ.get("OPENAI_API_KEY")
+        if not api_key:
+            if not self.base_url:
+                raise ValueError("OPENAI_API_KEY environment variable is not set. Please check your .env file.")
+            api_key = "local"  # local servers typically ignore the key
+        options = {"api_key": api_key, "timeout": self.timeout, "max_retries": 0}  # retries happen in complete()
+        if self.base_url:
+            options["base_url"] = self.base_url
+        if httpx is not None:
+            connections = self.concurrency.maximum
+            options["http_client"] = httpx.Client(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=connections, max_keepalive_connections=connections),
+            )
+        return OpenAI(**options)
+
+    def _request(self, prompt, temperature):
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=temperature,
+        )
+        usage = getattr(response, "usage", None)
+        return Completion(
+            response.choices[0].message.content,
+            getattr(usage, "prompt_tokens", None),
+            getattr(usage, "completion_tokens", None),
+        )
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """The shared backend, an OpenAIBackend configured from language.config by default."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = OpenAIBackend()
+        return _backend
+
+
+def set_backend(backend):
+    global _backend
+    with _backend_lock:
+        _backend = backend
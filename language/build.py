@@ -0,0 +1,235 @@
+# language/build.py
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from .artifact import artifact_path, load_artifact, write_artifact
+
+MANIFEST_NAME = "build-manifest.json"
+
+
+def build_file(file_path, rebuild=False, max_in_flight=None, use_cache=True):
+    """
+    Return the compiled code object for a .nature file, loading it from the
+    artifact next to the file when that is still valid and building (and
+    saving) a new artifact otherwise.
+    """
+    if not rebuild:
+        payload = load_artifact(file_path)
+        if payload is not None:
+            return payload["code"]
+
+    from .code_generator import generate_document_code
+    from .parser import generate_functions
+    from .utils import iter_nature_file
+
+    # Generation of the first functions starts while the rest of the file is still being parsed.
+    functions = generate_functions(iter_nature_file(file_path), max_in_flight=max_in_flight, use_cache=use_cache)
+    full_code = generate_document_code(functions)
+    if any(func.generated_code.startswith("# Error") for func in functions):
+        # Don't persist a build with failed generations; retry them next run.
+        return compile(full_code, str(file_path), "exec")
+    return write_artifact(file_path, full_code, functions)
+
+
+def run_file(file_path, rebuild=False, resume=False):
+    """
+    Build file_path if needed and execute it as a main program. With resume,
+    checkpointed results of functions that already succeeded are reused.
+    """
+    code = build_file(file_path, rebuild=rebuild)
+    if resume:
+        from . import runtime
+        runtime.RESUME = True
+    exec(code, {"__name__": "__main__"})
+
+
+def find_nature_files(directory):
+    return sorted(path for path in Path(directory).rglob("*.nature") if path.is_file())
+
+
+def _compile_file(file_path, functions):
+    """
+    Process pool task: assemble, compile and save the artifact for one file
+    whose functions all have code. Returns (status, timings).
+    """
+    from .code_generator import generate_document_code
+
+    started = time.perf_counter()
+    full_code = generate_document_code(functions)
+    codegen_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    if any(func.generated_code.startswith("# Error") for func in functions):
+        # Same rule as build_file: no artifact for a build with failed generations.
+        compile(full_code, str(file_path), "exec")
+        status = "failed"
+    else:
+        write_artifact(file_path, full_code, functions)
+        status = "built"
+    return status, {"codegen_seconds": codegen_seconds, "compile_seconds": time.perf_counter() - started}
+
+
+def _unique_name(name, taken):
+    """name, or the next function_N not in taken. Batched requests key their answers by name."""
+    if name not in taken:
+        return name
+    n = len(taken) + 1
+    while f"function_{n}" in taken:
+        n += 1
+    return f"function_{n}"
+
+
+def build_directory(directory, rebuild=False, workers=None, max_in_flight=None, batch_size=None,
+                    use_cache=True, manifest_path=None):
+    """
+    Build every .nature file under directory. Functions from all files go
+    through one generation queue, de-duplicated by instruction hash, so
+    instructions repeated across files are generated once. As soon as all of a
+    file's functions have code, the file is handed to a pool of worker
+    processes that assemble, compile and save its artifact, while generation
+    continues for the rest. Files whose artifact is still valid are skipped
+    unless rebuild. Writes a JSON manifest with per-file and per-phase timings
+    and returns it.
+    """
+    from .ast import FunctionDefinition
+    from .incremental import instruction_hash
+    from .parser import generate_functions
+    from .utils import parse_nature_document, load_nature_file
+
+    workers = workers or os.cpu_count() or 1
+    manifest_path = Path(manifest_path or Path(directory) / MANIFEST_NAME)
+    build_started = time.perf_counter()
+    phases = {}
+    entries = {}
+
+    started = time.perf_counter()
+    paths = find_nature_files(directory)
+    pending = []
+    for path in paths:
+        if not rebuild and load_artifact(path) is not None:
+            entries[path] = {"path": str(path), "status": "up to date"}
+        else:
+            pending.append(path)
+    phases["discover_seconds"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    documents = {}
+    for path in pending:
+        parse_started = time.perf_counter()
+        documents[path] = parse_nature_document(load_nature_file(path))
+        entries[path] = {
+            "path": str(path),
+            "artifact": str(artifact_path(path)),
+            "functions": len(documents[path]),
+            "parse_seconds": time.perf_counter() - parse_started,
+            # Until its compile task reports; a file whose functions never all arrive stays failed.
+            "status": "failed",
+        }
+    phases["parse_seconds"] = time.perf_counter() - started
+
+    # One representative FunctionDefinition per distinct instruction text.
+    representatives = {}
+    taken = set()
+    copies = {}
+    remaining = {}
+    for path, functions in documents.items():
+        remaining[path] = len(functions)
+        for func in functions:
+            key = instruction_hash(func.instructions)
+            if key not in representatives:
+                name = _unique_name(func.name, taken)
+                taken.add(name)
+                representatives[key] = FunctionDefinition(name, func.instructions, None)
+            copies.setdefault(key, []).append((path, func))
+
+    method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    futures = {}
+    lock = threading.Lock()
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(method)) as pool:
+        def submit(path):
+            entries[path]["ready_after_seconds"] = time.perf_counter() - build_started
+            futures[path] = pool.submit(_compile_file, str(path), documents[path])
+
+        def on_generated(rep):
+            ready = []
+            with lock:
+                for path, func in copies[instruction_hash(rep.instructions)]:
+                    func.generated_code = rep.generated_code
+                    remaining[path] -= 1
+                    if remaining[path] == 0:
+                        ready.append(path)
+                for path in ready:
+                    submit(path)
+
+        for path, count in remaining.items():
+            if count == 0:
+                submit(path)
+        started = time.perf_counter()
+        generate_functions(list(representatives.values()), max_in_flight=max_in_flight, use_cache=use_cache,
+                           on_generated=on_generated, batch_size=batch_size)
+        phases["generate_seconds"] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for path, future in futures.items():
+            try:
+                status, timings = future.result()
+            except Exception as e:
+                status, timings = "failed", {"error": str(e)}
+            entries[path].update(timings, status=status)
+    phases["compile_wait_seconds"] = time.perf_counter() - started
+
+    files = [entries[path] for path in paths]
+    manifest = {
+        "directory": str(directory),
+        "created": time.time(),
+        "workers": workers,
+        "total_seconds": time.perf_counter() - build_started,
+        "phases": phases,
+        "files": len(files),
+        "built": sum(entry.get("status") == "built" for entry in files),
+        "up_to_date": sum(entry.get("status") == "up to date" for entry in files),
+        "failed": sum(entry.get("status") == "failed" for entry in files),
+        "functions": sum(len(functions) for functions in documents.values()),
+        "unique_functions": len(representatives),
+        "entries": files,
+    }
+    tmp_path = manifest_path.with_suffix(".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, manifest_path)
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build every .nature file under a directory.")
+    parser.add_argument("directory", help="directory to search for .nature files")
+    parser.add_argument("--rebuild", action="store_true", help="rebuild files whose artifact is still valid")
+    parser.add_argument("--workers", type=int, default=None, help="processes for code assembly and compilation (default: CPU count)")
+    parser.add_argument("--max-in-flight", type=int, default=None, help="maximum concurrent generation requests")
+    parser.add_argument("--batch-size", type=int, default=None, help="pack up to this many functions into one generation request")
+    parser.add_argument("--no-cache", action="store_true", help="bypass the generated code cache")
+    parser.add_argument("--manifest", default=None, help=f"where to write the build manifest (default DIRECTORY/{MANIFEST_NAME})")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.directory):
+        print(f"Error: {args.directory} is not a directory")
+        return 1
+    manifest = build_directory(args.directory, rebuild=args.rebuild, workers=args.workers,
+                               max_in_flight=args.max_in_flight, batch_size=args.batch_size,
+                               use_cache=not args.no_cache, manifest_path=args.manifest)
+    for entry in manifest["entries"]:
+        print(f"{entry.get('status', 'failed'):>10}  {entry['path']}")
+    print(f"{manifest['files']} files, {manifest['functions']} functions ({manifest['unique_functions']} distinct): "
+          f"{manifest['built']} built, {manifest['up_to_date']} up to date, {manifest['failed']} failed "
+          f"in {manifest['total_seconds']:.2f}s")
+    return 1 if manifest["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+# language/cache.py
+import hashlib
+import sqlite3
+import threading
+import time
+from . import config
+
+
+def normalize_instructions(text):
+    """Collapse whitespace so formatting-only edits map to the same cache entry."""
+    lines = (" ".join(line.split()) for line in text.strip().splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+def generation_key(instructions, model, temperature, prompt_version):
+    """Content hash identifying one generation request."""
+    payload = "\0".join([
+        normalize_instructions(instructions),
+        model,
+        repr(temperature),
+        str(prompt_version),
+    ])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class GenerationCache:
+    """SQLite-backed store of generated code with size- and age-based eviction."""
+
+    def __init__(self, path, max_bytes=config.CACHE_MAX_BYTES, max_age=config.CACHE_MAX_AGE):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                "created REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+            self._evict()
+        return self._conn
+
+    def get(self, key):
+        """Return the cached value for key, or None on a miss."""
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT value, created FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            now = time.time()
+            if row is None or now - row[1] > self.max_age:
+                self.misses += 1
+                return None
+            conn.execute("UPDATE entries SET last_used = ? WHERE key = ?", (now, key))
+            conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, value):
+        with self._lock:
+            conn = self._connect()
+            now = time.time()
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, created, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value.encode("utf-8")), now, now),
+            )
+            self._evict()
+            conn.commit()
+
+    def _evict(self):
+        """Drop expired entries, then least recently used ones until under max_bytes."""
+        conn = self._conn
+        conn.execute("DELETE FROM entries WHERE created < ?", (time.time() - self.max_age,))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total > self.max_bytes:
+            rows = conn.execute("SELECT key, size FROM entries ORDER BY last_used").fetchall()
+            for key, size in rows:
+                if total <= self.max_bytes:
+                    break
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                total -= size
+        conn.commit()
+
+    def clear(self):
+        """Remove every entry and reset the counters."""
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM entries")
+            conn.commit()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            conn = self._connect()
+            entries, size = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+            ).fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "bytes": size}
+
+
+_cache = None
+
+
+def get_cache():
+    """Return the shared generation cache, or None when caching is disabled."""
+    global _cache
+    if not config.CACHE_ENABLED:
+        return None
+    if _cache is None:
+        _cache = GenerationCache(config.CACHE_DIR / "generation.sqlite3")
+    return _cache
@@ -1,9 +1,18 @@
 # nature/code_generator.py
+import hashlib
 import textwrap
 import importlib
+import importlib.util
 import sys
 import subprocess
 from pathlib import Path
+from .importer import module_cache
+from .profiler import traced
+from .rewriter import FunctionBody, parse_state_key
+from .validator import implicit_imports
+
+# The generated program imports language.runtime, so it needs the project root on sys.path.
+PROJECT_ROOT = str(Path(__file__).resolve().parent.parent)
 
 class ModuleManager:
     def __init__(self):
@@ -23,14 +32,11 @@ class ModuleManager:
         except ImportError:
             pass
         
-        # Then check our module paths
+        # Then check our module paths; file modules are loaded once and shared via sys.modules
         for base_path in self.module_paths:
             module_path = base_path / f"{module_name}.py"
             if module_path.exists():
-                spec = importlib.util.spec_from_file_location(module_name, module_path)
-                module = importlib.util.module_from_spec(spec)
-                spec.loader.exec_module(module)
-                return module
+                return module_cache.load_python(module_name, module_path)
         
         raise ImportError(f"Module {module_name} not found in standard library or module paths")
     
@@ -47,116 +53,161 @@ class ModuleManager:
             print(f"Warning: Could not load module {module_name}: {e}")
 
 def extract_imports(code):
-    """Extract all imports from the code."""
-    imports = set()
-    for line in code.split('\n'):
-        line = line.strip()
-        if line.startswith('import ') or line.startswith('from '):
-            # Extract the module name
-            if line.startswith('import '):
-                module = line.split('import ')[1].split()[0]
-            else:  # from ... import ...
-                module = line.split('from ')[1].split()[0]
-            imports.add(module)
-    return imports
+    """Extract the modules imported by plain `import` statements in the code."""
+    return FunctionBody(code).imports
+
+def build_dependency_graph(functions, bodies, module_names):
+    """
+    Work out which earlier functions each function must wait for, from the
+    references its rewritten body makes (bodies must already be rewritten):
+    results of earlier functions, global_env keys another function writes,
+    and shared files such as SQLite databases or the program's output. A
+    function that uses global_env in a way that can't be analysed acts as a
+    barrier. Returns {name: [names of functions it depends on]} in linear time.
+    """
+    function_names = {func.name for func in functions}
+    last_writer = {}        # key -> last function that wrote it
+    readers = {}            # key -> functions that read it since that write
+    barrier = None
+    since_barrier = []
+    graph = {}
+    for func, body in zip(functions, bodies):
+        deps = set()
+        if body.dynamic_env:
+            deps.update(since_barrier)
+            if barrier:
+                deps.add(barrier)
+        else:
+            if barrier:
+                deps.add(barrier)
+            writes = {key for key in body.env_writes if key not in module_names}
+            writes.update(f"file:{path}" for path in body.resources)
+            reads = {key for key in body.env_reads if key not in module_names} - writes
+            for key in reads:
+                if key in last_writer:
+                    deps.add(last_writer[key])
+            for key in writes:
+                if key in last_writer:
+                    deps.add(last_writer[key])
+                deps.update(readers.get(key, ()))
+            for key in reads:
+                readers.setdefault(key, []).append(func.name)
+            for key in writes:
+                last_writer[key] = func.name
+                readers[key] = []
+        # A function's own result is written under its name when it finishes.
+        last_writer[func.name] = func.name
+        readers[func.name] = []
+        deps.discard(func.name)
+        graph[func.name] = sorted(deps & function_names, key=lambda name: int(name.rsplit("_", 1)[1]))
+        if body.dynamic_env:
+            barrier, since_barrier = func.name, []
+        else:
+            since_barrier.append(func.name)
+    return graph
 
+def render_body(body, index, module_names):
+    """
+    The indented body of the function at position index: hoisted imports
+    removed and module and earlier-function references rewritten, in a single
+    pass over the body's tokens.
+    """
+    func_body = body.rewrite(index, module_names) or "pass"
+    func_body = textwrap.dedent(func_body)  # Remove any common leading whitespace
+    return textwrap.indent(func_body, "    ")  # Add proper indentation
+
+def function_definition(name, func_body):
+    """The def statement for a generated function, given its rendered body."""
+    return f"def {name}():\n    global global_env\n{func_body}"
+
+@traced("codegen")
 def generate_document_code(functions):
     """
     For each FunctionDefinition, generate a Python function.
     Also create a main block that calls each function while sharing a global context.
     """
     code_lines = ["# Auto-generated Python code from .nature document", ""]
-    
-    # Add ModuleManager class definition
-    code_lines.append("class ModuleManager:")
-    code_lines.append("    def __init__(self):")
-    code_lines.append("        self.global_env = {}")
-    code_lines.append("        self.loaded_modules = set()")
-    code_lines.append("")
-    code_lines.append("    def load_module(self, name):")
-    code_lines.append("        if name not in self.loaded_modules:")
-    code_lines.append("            try:")
-    code_lines.append("                module = __import__(name)")
-    code_lines.append("                self.global_env[name] = module")
-    code_lines.append("                self.loaded_modules.add(name)")
-    code_lines.append("            except ImportError as e:")
-    code_lines.append("                print(f'Warning: Could not load module {name}: {e}')")
+    code_lines.append("import sys")
+    code_lines.append(f"if {PROJECT_ROOT!r} not in sys.path:")
+    code_lines.append(f"    sys.path.insert(0, {PROJECT_ROOT!r})")
+    code_lines.append("from language.runtime import DatabasePool, ModuleManager, run_functions")
     code_lines.append("")
     
     # Initialize module manager and global environment
     code_lines.append("module_manager = ModuleManager()")
     code_lines.append("global_env = module_manager.global_env")
+    # Shared SQLite connections, one per named database, reused by every function
+    code_lines.append("db = global_env['db'] = DatabasePool()")
+    # Scratch space the generation prompt tells functions to share values through
+    code_lines.append("global_context = global_env['global_context'] = {}")
     code_lines.append("")
     
-    # Collect all imports from all functions
+    # Tokenize every body once and collect all imports from all functions
+    bodies = [FunctionBody(func.generated_code) for func in functions]
     all_imports = set()
-    for func in functions:
-        if func.generated_code:
-            all_imports.update(extract_imports(func.generated_code))
+    for body in bodies:
+        all_imports.update(body.imports)
+    # Modules used without an import pass validation, so import them here
+    implicit = set()
+    for i, (func, body) in enumerate(zip(functions, bodies)):
+        implicit.update(implicit_imports(func.name, body, i, all_imports))
+    all_imports.update(implicit)
     
-    # Load required modules
+    # Register required modules; each is imported when a function first uses it
     for module in sorted(all_imports):
         code_lines.append(f"module_manager.load_module('{module}')")
     code_lines.append("")
     
     # Generate function definitions
-    for i, func in enumerate(functions):
-        func_body = func.generated_code
-        # Clean up the function body
-        func_body = "\n".join(line for line in func_body.split("\n") 
-                            if not line.strip().startswith("It's not clear") and
-                            not line.strip().startswith("Without more context") and
-                            not line.strip().startswith("However") and
-                            not line.strip().startswith("If") and
-                            not line.strip().startswith("```") and
-                            not line.strip().startswith("Output:"))
-        
-        # Basic cleanup of function body
-        func_body = func_body.strip()
-        
-        # Remove imports from function body since they're handled by module_manager
-        func_body = "\n".join(line for line in func_body.split("\n") 
-                            if not line.strip().startswith("import") and 
-                            not line.strip().startswith("from"))
-        
-        # Replace direct module references with global_env access
-        for module in all_imports:
-            func_body = func_body.replace(f"{module}.", f"global_env['{module}'].")
-        
-        # Replace function references with proper function calls
-        for j, other_func in enumerate(functions):
-            if j < i:  # Only replace references to previous functions
-                func_body = func_body.replace(f"function_{j+1}()", f"global_env['function_{j+1}']")
-                func_body = func_body.replace("previous_function()", f"global_env['function_{i}']")
-                # Add more flexible function references
-                func_body = func_body.replace(f"function {j+1}", f"global_env['function_{j+1}']")
-                func_body = func_body.replace(f"function before this one", f"global_env['function_{i}']")
-        
-        # Fix indentation in the function body
-        func_body = textwrap.dedent(func_body)  # Remove any common leading whitespace
-        func_body = textwrap.indent(func_body, "    ")  # Add proper indentation
-        
-        code_lines.append(f"def {func.name}():")
-        code_lines.append("    global global_env")
-        code_lines.append(func_body)
+    function_sources = {}
+    for i, (func, body) in enumerate(zip(functions, bodies)):
+        func_body = render_body(body, i, all_imports)
+        code_lines.append(function_definition(func.name, func_body))
         code_lines.append("")
+        function_sources[func.name] = func_body
+    
+    # Record which functions each one waits for, so independent ones can run concurrently
+    dependencies = build_dependency_graph(functions, bodies, all_imports)
+    code_lines.append("DEPENDENCIES = {")
+    for name, deps in dependencies.items():
+        code_lines.append(f"    {name!r}: {deps!r},")
+    code_lines.append("}")
+    code_lines.append("")
+    
+    # Checkpoint keys cover each function's code and everything upstream of it.
+    # A checkpoint holds the function's result and the global_env keys it
+    # writes, so restoring it leaves global_env as running it would have.
+    # Functions using the shared databases are always re-run (restoring their
+    # result wouldn't recreate the tables later functions expect), as are
+    # functions whose global_env use can't be analysed.
+    checkpoint_keys = {}
+    for name, deps in dependencies.items():
+        parts = [function_sources[name]] + [checkpoint_keys[dep] for dep in deps]
+        checkpoint_keys[name] = hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+    checkpoint_writes = {}
+    for func, body in zip(functions, bodies):
+        if body.dynamic_env or "db" in body.env_writes:
+            del checkpoint_keys[func.name]
+            continue
+        writes = sorted(parse_state_key(key) for key in body.env_writes if key not in all_imports)
+        if writes:
+            checkpoint_writes[func.name] = writes
+    code_lines.append("CHECKPOINT_KEYS = {")
+    for name, key in checkpoint_keys.items():
+        code_lines.append(f"    {name!r}: {key!r},")
+    code_lines.append("}")
+    code_lines.append("CHECKPOINT_WRITES = {")
+    for name, writes in checkpoint_writes.items():
+        code_lines.append(f"    {name!r}: {writes!r},")
+    code_lines.append("}")
+    code_lines.append("")
     
     # Add a main block that calls all functions and stores their return values
     code_lines.append("if __name__ == '__main__':")
     code_lines.append("    try:")
-    for func in functions:
-        code_lines.append(f"        print('Running {func.name}...')")
-        code_lines.append("        try:")
-        code_lines.append(f"            result = {func.name}()")
-        code_lines.append(f"            global_env['{func.name}'] = result")
-        code_lines.append("            if result is not None:")
-        code_lines.append("                print('Result:', result)")
-        code_lines.append("        except Exception as e:")
-        code_lines.append(f"            print('Error in {func.name}:', e)")
-        code_lines.append("            import traceback")
-        code_lines.append("            traceback.print_exc()")
-        code_lines.append(f"            global_env['{func.name}_error'] = str(e)")
-        code_lines.append("")
+    function_list = ", ".join(func.name for func in functions)
+    code_lines.append(f"        run_functions([{function_list}], DEPENDENCIES, global_env, "
+                      "checkpoint_keys=CHECKPOINT_KEYS, checkpoint_writes=CHECKPOINT_WRITES)")
     code_lines.append("    except Exception as e:")
     code_lines.append("        print('Fatal error:', e)")
     code_lines.append("        import traceback")
@@ -171,5 +222,7 @@ def generate_document_code(functions):
     code_lines.append("        if response == 'y':")
     code_lines.append("            print('\\nGenerated code:')")
     code_lines.append("            print('\\n'.join(code_lines))")
+    code_lines.append("    finally:")
+    code_lines.append("        db.close()")
     
     return "\n".join(code_lines)
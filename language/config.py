@@ -0,0 +1,56 @@
+# language/config.py
+import os
+from pathlib import Path
+
+# Model settings shared by code generation and debugging suggestions.
+MODEL = os.environ.get("NATURE_MODEL", "gpt-4")
+GENERATION_TEMPERATURE = 0
+DEBUG_TEMPERATURE = 0.7
+
+# Model endpoint. NATURE_LLM_BASE_URL points the client at any OpenAI-compatible
+# server, e.g. a local stand-in (benchmarks/fake_server.py) for tests.
+LLM_BASE_URL = os.environ.get("NATURE_LLM_BASE_URL") or None
+LLM_TIMEOUT = float(os.environ.get("NATURE_LLM_TIMEOUT", 120))
+
+# Client-side rate limits (0 disables a limit) and retry policy. Rate-limited and
+# transient failures are retried with exponential backoff and jitter.
+LLM_REQUESTS_PER_MINUTE = int(os.environ.get("NATURE_LLM_RPM", 0))
+LLM_TOKENS_PER_MINUTE = int(os.environ.get("NATURE_LLM_TPM", 0))
+LLM_MAX_RETRIES = int(os.environ.get("NATURE_LLM_MAX_RETRIES", 5))
+LLM_BACKOFF_BASE = float(os.environ.get("NATURE_LLM_BACKOFF_BASE", 1.0))
+LLM_BACKOFF_MAX = float(os.environ.get("NATURE_LLM_BACKOFF_MAX", 60.0))
+
+# Bump whenever the generation prompt changes so cached code from the old prompt is not reused.
+PROMPT_VERSION = 2
+
+# Generated bodies are parsed, compiled and checked for undefined names as soon as
+# they arrive; failures are re-prompted with the error up to REPAIR_ATTEMPTS times.
+VALIDATION_ENABLED = not os.environ.get("NATURE_NO_VALIDATE")
+REPAIR_ATTEMPTS = int(os.environ.get("NATURE_REPAIR_ATTEMPTS", 2))
+
+# Maximum number of generation requests in flight at once.
+MAX_IN_FLIGHT = int(os.environ.get("NATURE_MAX_IN_FLIGHT", 8))
+
+# Batched generation: how many functions to pack into one request, and a budget
+# on the estimated completion tokens per request (generated code runs about
+# BATCH_CODE_EXPANSION times the length of its instructions).
+BATCH_SIZE = int(os.environ.get("NATURE_BATCH_SIZE", 1))
+BATCH_TOKEN_BUDGET = int(os.environ.get("NATURE_BATCH_TOKEN_BUDGET", 4000))
+BATCH_CODE_EXPANSION = 8
+
+# On-disk cache for generated code.
+CACHE_DIR = Path(os.environ.get("NATURE_CACHE_DIR", Path.home() / ".cache" / "nature"))
+CACHE_ENABLED = not os.environ.get("NATURE_NO_CACHE")
+CACHE_MAX_BYTES = int(os.environ.get("NATURE_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+CACHE_MAX_AGE = float(os.environ.get("NATURE_CACHE_MAX_AGE_DAYS", 30)) * 24 * 60 * 60
+
+# Function checkpoints (see language/runtime.py) are evicted once older than
+# CHECKPOINT_MAX_AGE, then oldest first until they fit in CHECKPOINT_MAX_BYTES.
+CHECKPOINT_MAX_BYTES = int(os.environ.get("NATURE_CHECKPOINT_MAX_BYTES", 256 * 1024 * 1024))
+CHECKPOINT_MAX_AGE = float(os.environ.get("NATURE_CHECKPOINT_MAX_AGE_DAYS", 7)) * 24 * 60 * 60
+
+# Unix socket of the warm compile/run daemon (python -m language.daemon).
+DAEMON_SOCKET = Path(os.environ.get("NATURE_DAEMON_SOCKET", CACHE_DIR / "daemon.sock"))
+
+# Reuse code generated for instructions that differ only in their quoted strings and numbers.
+TEMPLATE_CACHE_ENABLED = not os.environ.get("NATURE_NO_TEMPLATE_CACHE")
@@ -0,0 +1,219 @@
+# language/daemon.py
+"""
+A long-running server that keeps the parser, model client, caches and
+common imports loaded, so the nature CLI can compile and run documents
+without paying for a fresh Python process each time.
+
+    python -m language.daemon            # serve on config.DAEMON_SOCKET
+    python -m language.daemon --stop
+    python -m language.daemon --run examples/demo.nature
+
+Protocol, over a Unix stream socket: the client sends one JSON line
+{"command": "run" | "compile" | "ping" | "stop", "path": ..., "cwd": ...,
+"resume": bool, "rebuild": bool}. The server answers with frames of one tag
+byte, the payload length as 8 hex digits, and the payload:
+    o  stdout text      e  stderr text      x  exit status (decimal)
+Each request is served by a forked child of the warm server, so runs can't
+see each other's state.
+"""
+import argparse
+import importlib
+import json
+import os
+import signal
+import socket
+import socketserver
+import sys
+import threading
+import traceback
+from . import config
+
+PRELOAD_MODULES = (
+    "sqlite3", "json", "math", "random", "re", "datetime",
+    "collections", "itertools", "csv", "statistics",
+)
+
+
+def write_frame(sock, tag, payload):
+    data = payload.encode("utf-8")
+    sock.sendall(tag + f"{len(data):08x}".encode("ascii") + data)
+
+
+def read_frames(sock):
+    """Yield (tag, text) frames until the server closes the connection."""
+    stream = sock.makefile("rb")
+    while True:
+        header = stream.read(9)
+        if len(header) < 9:
+            return
+        yield header[:1], stream.read(int(header[1:], 16)).decode("utf-8", errors="replace")
+
+
+class _FrameWriter:
+    """File-like object sending everything written to it as frames of one tag."""
+
+    def __init__(self, sock, tag, lock):
+        self.sock = sock
+        self.tag = tag
+        self.lock = lock
+
+    def write(self, text):
+        if text:
+            with self.lock:
+                write_frame(self.sock, self.tag, text)
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+def warm_up():
+    """Import everything a run needs and create the model client up front."""
+    from . import build, code_generator, parser, runtime, templates  # noqa: F401
+    from .backends import get_backend
+
+    for name in PRELOAD_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            pass
+    try:
+        get_backend().client
+    except Exception as e:
+        print(f"Warning: model client not created: {e}", file=sys.stderr)
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline() or b"{}")
+        except ValueError as e:
+            write_frame(self.connection, b"e", f"Bad request: {e}\n")
+            write_frame(self.connection, b"x", "2")
+            return
+        command = request.get("command")
+        if command == "ping":
+            write_frame(self.connection, b"o", f"nature daemon {os.getppid()}\n")
+            write_frame(self.connection, b"x", "0")
+            return
+        if command == "stop":
+            os.kill(os.getppid(), signal.SIGTERM)
+            write_frame(self.connection, b"x", "0")
+            return
+        if command not in ("run", "compile"):
+            write_frame(self.connection, b"e", f"Unknown command: {command!r}\n")
+            write_frame(self.connection, b"x", "2")
+            return
+
+        lock = threading.Lock()
+        sys.stdout = _FrameWriter(self.connection, b"o", lock)
+        sys.stderr = _FrameWriter(self.connection, b"e", lock)
+        sys.stdin = open(os.devnull)
+        status = 0
+        try:
+            os.chdir(request.get("cwd") or os.getcwd())
+            status = self.serve(command, request)
+        except SystemExit as e:
+            status = e.code if isinstance(e.code, int) else 1
+        except BaseException:
+            traceback.print_exc()
+            status = 1
+        finally:
+            sys.stdout, sys.stderr = sys.__stdout__, sys.__stderr__
+        write_frame(self.connection, b"x", str(status))
+
+    def serve(self, command, request):
+        from .build import build_file, run_file
+
+        path = request["path"]
+        if command == "compile":
+            build_file(path, rebuild=request.get("rebuild", False))
+            print(f"Compiled {path}")
+        else:
+            run_file(path, rebuild=request.get("rebuild", False), resume=request.get("resume", False))
+        return 0
+
+
+class DaemonServer(socketserver.ForkingMixIn, socketserver.UnixStreamServer):
+    block_on_close = False
+
+
+def is_running(socket_path=None):
+    try:
+        return request({"command": "ping"}, socket_path)[0] == 0
+    except OSError:
+        return False
+
+
+def serve(socket_path=None):
+    socket_path = str(socket_path or config.DAEMON_SOCKET)
+    if os.path.exists(socket_path):
+        if is_running(socket_path):
+            print(f"A nature daemon is already listening on {socket_path}")
+            return 1
+        os.unlink(socket_path)  # left behind by a daemon that didn't shut down cleanly
+    os.makedirs(os.path.dirname(socket_path) or ".", exist_ok=True)
+
+    warm_up()
+    server = DaemonServer(socket_path, RequestHandler)
+    os.chmod(socket_path, 0o600)
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+    print(f"nature daemon {os.getpid()} listening on {socket_path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+    return 0
+
+
+def request(message, socket_path=None, on_output=None):
+    """
+    Send one request to the daemon. on_output(tag, text) receives output as
+    it streams ("o" for stdout, "e" for stderr). Returns (exit status, output).
+    """
+    output = []
+    status = 1
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(str(socket_path or config.DAEMON_SOCKET))
+        sock.sendall(json.dumps(message).encode("utf-8") + b"\n")
+        for tag, text in read_frames(sock):
+            if tag == b"x":
+                status = int(text)
+            else:
+                output.append(text)
+                if on_output is not None:
+                    on_output(tag.decode("ascii"), text)
+    return status, "".join(output)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Keep a warm Nature compiler and runtime available over a Unix socket.")
+    parser.add_argument("--socket", default=None, help=f"socket path (default {config.DAEMON_SOCKET})")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--stop", action="store_true", help="stop the running daemon")
+    group.add_argument("--status", action="store_true", help="report whether a daemon is running")
+    group.add_argument("--run", metavar="FILE", help="run a .nature file through the running daemon")
+    args = parser.parse_args(argv)
+
+    if args.stop or args.status:
+        running = is_running(args.socket)
+        if running and args.stop:
+            request({"command": "stop"}, args.socket)
+        print("running" if running else "not running")
+        return 0 if running else 1
+    if args.run:
+        def echo(tag, text):
+            stream = sys.stdout if tag == "o" else sys.stderr
+            stream.write(text)
+            stream.flush()
+        message = {"command": "run", "path": os.path.abspath(args.run), "cwd": os.getcwd()}
+        return request(message, args.socket, on_output=echo)[0]
+    return serve(args.socket)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,50 +1,186 @@
 # language/debugger.py
+import bisect
+import hashlib
+import re
 import traceback
-from language.parser import llm_debug_suggestion
+from concurrent.futures import ThreadPoolExecutor
+from language import config
+from language.profiler import in_context, span
+from language.runtime import InvalidFunctionError
 
-def run_generated_code(full_code, functions):
+FUNCTION_DEF = re.compile(r"^def (function_\d+)\(\):", re.MULTILINE)
+FUNCTION_NAME = re.compile(r"function_\d+")
+# Parts of an error message that vary between otherwise identical failures.
+VOLATILE_DETAILS = re.compile(r"0x[0-9a-fA-F]+|\b\d+(\.\d+)?\b|'[^']*'|\"[^\"]*\"")
+
+def error_signature(exc):
+    """Normalize an exception to its type and message shape, e.g. "KeyError: <v>"."""
+    message = VOLATILE_DETAILS.sub("<v>", str(exc))
+    return f"{type(exc).__name__}: {message}"
+
+def build_line_map(full_code):
+    """
+    Return a sorted list of (first line, function name) for each generated
+    function, from the source text or from a compiled code object's nested
+    function code objects.
+    """
+    if isinstance(full_code, str):
+        line_starts = [0] + [m.end() for m in re.finditer("\n", full_code)]
+        return sorted(
+            (bisect.bisect_right(line_starts, m.start()), m.group(1))
+            for m in FUNCTION_DEF.finditer(full_code)
+        )
+    return sorted(
+        (const.co_firstlineno, const.co_name)
+        for const in getattr(full_code, "co_consts", ())
+        if hasattr(const, "co_firstlineno") and FUNCTION_NAME.fullmatch(const.co_name)
+    )
+
+def find_failed_function(exc, functions, full_code):
+    """
+    Identify the generated function an exception came from: the innermost
+    traceback frame running a generated function, or, for errors without such
+    a frame (e.g. a SyntaxError), the function whose lines contain the error.
+    """
+    by_name = {func.name: func for func in functions}
+    failed = None
+    line = getattr(exc, "lineno", None) if isinstance(exc, SyntaxError) else None
+    tb = exc.__traceback__
+    while tb is not None:
+        name = tb.tb_frame.f_code.co_name
+        if name in by_name:
+            failed = by_name[name]
+        if tb.tb_frame.f_code.co_filename == getattr(full_code, "co_filename", "<string>"):
+            line = tb.tb_lineno
+        tb = tb.tb_next
+    if failed is not None or line is None:
+        return failed
+
+    line_map = build_line_map(full_code)
+    index = bisect.bisect_right([start for start, _ in line_map], line) - 1
+    if index >= 0:
+        return by_name.get(line_map[index][1])
+    return None
+
+class SuggestionCache:
+    """LLM debugging suggestions keyed by (code hash, normalized error signature)."""
+
+    def __init__(self):
+        self._memory = {}
+
+    def key(self, func, signature):
+        code_hash = hashlib.sha256((func.generated_code or "").encode("utf-8")).hexdigest()
+        payload = "\0".join(["debug", code_hash, signature, config.MODEL, repr(config.DEBUG_TEMPERATURE)])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def suggest(self, func, error_message, signature):
+        from language.cache import get_cache
+        from language.parser import llm_debug_suggestion
+
+        key = self.key(func, signature)
+        if key in self._memory:
+            return self._memory[key]
+        cache = get_cache()
+        suggestion = cache.get(key) if cache is not None else None
+        if suggestion is None:
+            suggestion = llm_debug_suggestion(func.instructions, error_message, func.generated_code)
+            if cache is not None and suggestion != "Could not generate debugging suggestion.":
+                cache.put(key, suggestion)
+        self._memory[key] = suggestion
+        return suggestion
+
+suggestion_cache = SuggestionCache()
+
+def first_runtime_failure(exec_globals, functions):
+    """
+    The earliest (in document order) function whose exception the generated
+    runtime caught and recorded, as (function, exception), or (None, None).
+    """
+    global_env = exec_globals.get("global_env") or {}
+    for func in functions:
+        exc = global_env.get(f"{func.name}_exception")
+        if isinstance(exc, BaseException):
+            return func, exc
+    return None, None
+
+def run_generated_code(full_code, functions, resume=False):
     """
     Executes the generated code in a shared globals environment.
+    full_code may be source text or an already compiled code object (e.g. from
+    a .naturec artifact), in which case no compilation happens here.
     Each function call is wrapped so that if an error occurs, the user is prompted
     whether to see debugging suggestions from the LLM.
+    With resume=True, functions whose checkpointed results from an earlier run
+    are still valid are restored instead of re-run, so execution effectively
+    restarts at the first function that failed.
     """
+    if resume:
+        from language import runtime
+        runtime.RESUME = True
     # Create a dedicated dictionary for globals, including a shared context.
-    exec_globals = {"global_context": {}}
+    # __name__ is set so the generated main block actually runs.
+    exec_globals = {"__name__": "__main__", "global_context": {}}
     try:
-        exec(full_code, exec_globals)
+        if isinstance(full_code, str):
+            with span("compile", "exec"):
+                full_code = compile(full_code, "<string>", "exec")
+        with span("run", "exec"):
+            exec(full_code, exec_globals)
+        # Errors inside functions are caught (and already printed) by the runtime.
+        failed_func, failure = first_runtime_failure(exec_globals, functions)
     except Exception as e:
-        error_message = traceback.format_exc()
+        failed_func, failure = None, e
         print("An error occurred during execution:")
-        print(error_message)
-        
-        # Try to identify which function failed based on the error message
-        failed_func = None
-        for func in functions:
-            if func.name in error_message:
-                failed_func = func
-                break
-        
-        # If we couldn't identify the failed function, use the last one
-        # (since errors often occur in later functions that depend on earlier ones)
-        if failed_func is None and functions:
-            failed_func = functions[-1]
-        
-        if failed_func:
-            suggestion = llm_debug_suggestion(failed_func.instructions, error_message, failed_func.generated_code)
-            print("\nLLM Debug Suggestion:")
-            print(suggestion)
-            
-            # Now, prompt the user interactively to see if they want more debugging help:
-            choice = input("Would you like further debugging suggestions? (Y/n): ").strip().lower()
-            if choice in ("y", "yes", ""):
-                # Offer suggestions for each function
-                for func in functions:
-                    print(f"\nLLM Debug Suggestion for {func.name}:")
-                    suggestion = llm_debug_suggestion(func.instructions, error_message, func.generated_code)
-                    print(suggestion)
-                    
-                    # Ask if they want to see suggestions for the next function
-                    if func != functions[-1]:
-                        continue_choice = input("See suggestions for next function? (Y/n): ").strip().lower()
-                        if continue_choice not in ("y", "yes", ""):
-                            break
\ No newline at end of file
+        print(traceback.format_exc())
+    if failure is None:
+        return
+    if isinstance(failure, InvalidFunctionError):
+        # Repair prompts already failed for this code; another suggestion won't help.
+        print("\nRun the document again to retry the repair, or reword the function's instructions.")
+        return
+
+    error_message = "".join(traceback.format_exception(type(failure), failure, failure.__traceback__))
+    signature = error_signature(failure)
+    if failed_func is None:
+        failed_func = find_failed_function(failure, functions, full_code)
+
+    # If we couldn't identify the failed function, use the last one
+    # (since errors often occur in later functions that depend on earlier ones)
+    if failed_func is None and functions:
+        failed_func = functions[-1]
+    if failed_func is None:
+        return
+
+    # Fetch suggestions for the other functions in the background while the
+    # user reads the first one.
+    executor = ThreadPoolExecutor(max_workers=config.MAX_IN_FLIGHT)
+    prefetched = {
+        func.name: executor.submit(in_context(suggestion_cache.suggest), func, error_message, signature)
+        for func in functions
+        if func is not failed_func
+    }
+    try:
+        if failed_func.location():
+            print(f"Failing function: {failed_func.name} ({failed_func.location()} of the source)")
+        suggestion = suggestion_cache.suggest(failed_func, error_message, signature)
+        print("\nLLM Debug Suggestion:")
+        print(suggestion)
+
+        # Now, prompt the user interactively to see if they want more debugging help:
+        choice = input("Would you like further debugging suggestions? (Y/n): ").strip().lower()
+        if choice in ("y", "yes", ""):
+            # Offer suggestions for each function
+            others = [func for func in functions if func is not failed_func]
+            for func in others:
+                print(f"\nLLM Debug Suggestion for {func.name}:")
+                print(prefetched[func.name].result())
+
+                # Ask if they want to see suggestions for the next function
+                if func is not others[-1]:
+                    continue_choice = input("See suggestions for next function? (Y/n): ").strip().lower()
+                    if continue_choice not in ("y", "yes", ""):
+                        break
+    except EOFError:
+        pass
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -1,33 +1,128 @@
 import os
+import hashlib
 import importlib.util
+import marshal
+import sys
+import threading
+from . import config
+
+BYTECODE_MAGIC = b"NATM"
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def file_stamp(path):
+    """(mtime, size) of path; a cheap check for whether the file changed."""
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+class ModuleCache:
+    """
+    Loaded Nature and Python modules, memoized by absolute path. An entry is
+    reused while the file's mtime and size are unchanged, so repeated loads
+    share one module. Compiled bytecode for .nature libraries is also kept on
+    disk, keyed by a hash of the source, so a fresh process doesn't recompile
+    a library that hasn't changed.
+    """
+
+    def __init__(self, bytecode_dir=None):
+        self.bytecode_dir = bytecode_dir or os.path.join(config.CACHE_DIR, "modules")
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._path_locks = {}
+
+    def _get(self, path, load):
+        path = os.path.abspath(path)
+        with self._lock:
+            lock = self._path_locks.setdefault(path, threading.Lock())
+        with lock:
+            stamp = file_stamp(path)
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == stamp:
+                return entry[1]
+            module = load(path)
+            self._entries[path] = (stamp, module)
+            return module
+
+    def _bytecode_path(self, source_hash):
+        return os.path.join(self.bytecode_dir, f"{source_hash}.naturebc")
+
+    def _compiled(self, path, source):
+        """The code object for a .nature library, from the on-disk bytecode cache when possible."""
+        source_hash = hashlib.sha256(source.encode("utf-8")).hexdigest()
+        bytecode_path = self._bytecode_path(source_hash)
+        try:
+            with open(bytecode_path, "rb") as f:
+                if f.read(len(BYTECODE_MAGIC)) == BYTECODE_MAGIC and f.read(len(importlib.util.MAGIC_NUMBER)) == importlib.util.MAGIC_NUMBER:
+                    return marshal.load(f)
+        except (OSError, EOFError, ValueError, TypeError):
+            pass
+        code = compile(source, path, "exec")
+        try:
+            os.makedirs(self.bytecode_dir, exist_ok=True)
+            tmp_path = f"{bytecode_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(BYTECODE_MAGIC)
+                f.write(importlib.util.MAGIC_NUMBER)
+                marshal.dump(code, f)
+            os.replace(tmp_path, bytecode_path)
+        except OSError as e:
+            print(f"Warning: could not cache bytecode for {path}: {e}")
+        return code
+
+    def load_nature(self, path):
+        """The environment of the .nature library at path, compiled and run once per version of the file."""
+        def load(path):
+            with open(path, "r") as f:
+                source = f.read()
+            module_env = {"__name__": os.path.splitext(os.path.basename(path))[0], "__file__": path}
+            exec(self._compiled(path, source), module_env)
+            return module_env
+        return self._get(path, load)
+
+    def load_python(self, name, path):
+        """
+        The Python module (source or extension) at path, registered in
+        sys.modules under name so every loader shares it.
+        """
+        def load(path):
+            spec = importlib.util.spec_from_file_location(name, path)
+            if spec is None or spec.loader is None:
+                raise ImportError(f"cannot load {path}")
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            sys.modules[name] = module
+            return module
+        return self._get(path, load)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+module_cache = ModuleCache()
+
 
 def load_module(module_name):
     """Resolves a module from Nature's Lib or Modules."""
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    lib_path = os.path.join(base_dir, "..", "lib", f"{module_name}.nature")
-    modules_path = os.path.join(base_dir, "..", "modules")
+    lib_path = os.path.join(BASE_DIR, "..", "lib", f"{module_name}.nature")
+    modules_path = os.path.join(BASE_DIR, "..", "modules")
 
     if os.path.exists(lib_path):
-        with open(lib_path, "r") as f:
-            code = f.read()
         # Compile the Nature module (using your own parser/compiler)
-        module_env = compile_nature_module(code)
-        return module_env
+        return module_cache.load_nature(lib_path)
     else:
         # For native modules, use Python's mechanisms
         try:
             module_file = os.path.join(modules_path, f"_{module_name}.so")
-            spec = importlib.util.spec_from_file_location(module_name, module_file)
-            module = importlib.util.module_from_spec(spec)
-            spec.loader.exec_module(module)
-            return module
+            return module_cache.load_python(module_name, module_file)
         except Exception as e:
             raise ImportError(f"Module '{module_name}' not found: {e}")
 
-def compile_nature_module(code):
+def compile_nature_module(code, filename="<nature>"):
     """Stub function to compile a Nature module from code."""
     module_env = {}
     # Here you would parse and compile the code.
     # For this example, we simply exec the code.
-    exec(code, module_env)
+    exec(compile(code, filename, "exec"), module_env)
     return module_env
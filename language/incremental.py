@@ -0,0 +1,119 @@
+# language/incremental.py
+import hashlib
+import os
+import re
+import time
+from .cache import normalize_instructions
+from .code_generator import generate_document_code
+from .utils import load_nature_file, parse_nature_document
+
+FUNCTION_REF_PATTERN = re.compile(r"\bfunction[_ ](\d+)\b", re.IGNORECASE)
+PREVIOUS_REF_PATTERN = re.compile(r"\b(function before this one|previous[_ ]function)\b", re.IGNORECASE)
+
+
+def instruction_hash(instructions):
+    return hashlib.sha256(normalize_instructions(instructions).encode("utf-8")).hexdigest()
+
+
+def function_references(instructions, index):
+    """
+    Return the names of earlier functions that the instructions of the function
+    at position index (0-based) refer to, either by name or as "the function
+    before this one".
+    """
+    refs = set()
+    for match in FUNCTION_REF_PATTERN.finditer(instructions):
+        number = int(match.group(1))
+        if 1 <= number <= index:
+            refs.add(f"function_{number}")
+    if index > 0 and PREVIOUS_REF_PATTERN.search(instructions):
+        refs.add(f"function_{index}")
+    return refs
+
+
+class IncrementalBuilder:
+    """
+    Rebuilds a document by regenerating only the functions whose instructions
+    changed since the previous build, plus any function that refers to one of
+    them. Everything else reuses the previously generated code.
+    """
+
+    def __init__(self, max_in_flight=None, use_cache=True):
+        self.max_in_flight = max_in_flight
+        self.use_cache = use_cache
+        # build key -> generated code from the previous build
+        self.previous = {}
+        self.previous_hashes = set()
+
+    def build_keys(self, functions):
+        """
+        Key each function by its own instruction hash and the keys of the
+        functions it references, so a change propagates to its dependents.
+        """
+        keys = {}
+        for i, func in enumerate(functions):
+            parts = [instruction_hash(func.instructions)]
+            for ref in sorted(function_references(func.instructions, i)):
+                parts.append(keys[ref])
+            keys[func.name] = hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+        return keys
+
+    def build(self, functions):
+        """Generate code for the changed functions and return (full_code, regenerated_names)."""
+        from .parser import generate_functions
+
+        keys = self.build_keys(functions)
+        changed, dependents = [], []
+        for func in functions:
+            cached = self.previous.get(keys[func.name])
+            if cached is not None:
+                func.generated_code = cached
+            elif instruction_hash(func.instructions) in self.previous_hashes:
+                # Same instructions, but something upstream changed. Skip the
+                # cache so it is not served the code built for the old upstream.
+                dependents.append(func)
+            else:
+                changed.append(func)
+
+        if changed:
+            generate_functions(changed, max_in_flight=self.max_in_flight, use_cache=self.use_cache)
+        if dependents:
+            generate_functions(dependents, max_in_flight=self.max_in_flight, use_cache=False)
+
+        self.previous = {
+            keys[func.name]: func.generated_code
+            for func in functions
+            if func.generated_code and not func.generated_code.startswith("# Error")
+        }
+        self.previous_hashes = {instruction_hash(func.instructions) for func in functions}
+        regenerated = {func.name for func in changed + dependents}
+        return generate_document_code(functions), [f.name for f in functions if f.name in regenerated]
+
+
+def watch(file_path, run, builder=None, interval=0.5):
+    """
+    Rebuild and re-run file_path every time it is saved. run is called with
+    (full_code, functions) after each build. Stops on Ctrl-C.
+    """
+    builder = builder or IncrementalBuilder()
+    last_mtime = None
+    print(f"Watching {file_path} for changes (Ctrl-C to stop)...")
+    try:
+        while True:
+            try:
+                mtime = os.stat(file_path).st_mtime_ns
+            except OSError:
+                mtime = None
+            if mtime is not None and mtime != last_mtime:
+                last_mtime = mtime
+                functions = parse_nature_document(load_nature_file(file_path))
+                started = time.perf_counter()
+                full_code, regenerated = builder.build(functions)
+                elapsed = time.perf_counter() - started
+                print(f"\n--- Rebuilt {len(regenerated)} of {len(functions)} functions in {elapsed:.2f}s ---")
+                if regenerated:
+                    print("Regenerated:", ", ".join(regenerated))
+                run(full_code, functions)
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        print("\nStopped watching.")
@@ -1,32 +1,29 @@
 # nature/parser.py
-import os
 import json
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 from dotenv import load_dotenv
-from openai import OpenAI
-from typing import List
-from .ast import FunctionDefinition
+from . import config
+from .backends import OpenAIBackend, estimate_tokens, get_backend, set_backend
+from .cache import generation_key, get_cache
+from .profiler import in_context, span
+from .templates import extract_template, template_cache
+from .validator import invalid_function_stub, validate_function_code
 
 # Load environment variables from .env file
 load_dotenv()
 
-# Get the API key and verify it exists
-api_key = os.environ.get("OPENAI_API_KEY")
-if not api_key:
-    raise ValueError("OPENAI_API_KEY environment variable is not set. Please check your .env file.")
+def set_client(client):
+    """Send requests through an existing OpenAI-style client, e.g. a local stand-in for benchmarks."""
+    set_backend(OpenAIBackend(client=client))
 
-# Initialize OpenAI client with the API key
-client = OpenAI(api_key=api_key)
-
-def llm_generate_function_code(nl_instructions):
-    prompt = f"""
-You are an expert programmer. Convert the following natural language function instructions into a valid Python code snippet that implements them. 
-Do not include the function definition line (i.e. "def function_1():") or extra commentary—just the body code indented as needed. and take care of all imports.
-
-Important rules:
+GENERATION_RULES = """Important rules:
 1. For SQL operations:
-   - Always use proper connection handling with try/finally
-   - Return query results before closing connections
-   - Use proper string quotes for SQL statements
+   - Use the shared connection pool `db` instead of calling sqlite3.connect yourself
+   - `db.connect()` returns the document's shared in-memory database; `db.connect("name.db")` a database file
+   - Every function gets the same connection, so tables created earlier are still there: never close it
+   - Insert many rows at once with `db.bulk_insert(table, rows)` (rows are tuples or dicts)
+   - Use ? placeholders for values and commit after writing
    - Include proper error handling
 
 2. For function interactions:
@@ -47,22 +44,14 @@ Example 1 (SQL):
   return this table
 
 Output:
-    import sqlite3
-    conn = sqlite3.connect(':memory:')
-    try:
-        c = conn.cursor()
-        c.execute('''CREATE TABLE Books (
-            id INTEGER PRIMARY KEY,
-            title text,
-            price real
-        )''')
-        c.execute("INSERT INTO Books VALUES (1, '1987', 4.44)")
-        c.execute("INSERT INTO Books VALUES (2, 'Learning Geology', 30)")
-        conn.commit()
-        c.execute("SELECT * FROM Books")
-        return c.fetchall()
-    finally:
-        conn.close()
+    conn = db.connect()
+    conn.execute('''CREATE TABLE IF NOT EXISTS Books (
+        id INTEGER PRIMARY KEY,
+        title text,
+        price real
+    )''')
+    db.bulk_insert("Books", [(1, '1987', 4.44), (2, 'Learning Geology', 30)])
+    return conn.execute("SELECT * FROM Books").fetchall()
 
 Example 2 (Function Interaction):
 Input:
@@ -70,19 +59,280 @@ Input:
 
 Output:
     print(function_1())
-Now, produce the Python code for the function:
+"""
+
+def _generation_key(nl_instructions):
+    return generation_key(nl_instructions, config.MODEL, config.GENERATION_TEMPERATURE, config.PROMPT_VERSION)
+
+def llm_generate_function_code(nl_instructions, use_cache=True):
+    """
+    Return code for nl_instructions. New code is not written to the disk
+    cache here: _ensure_valid caches it once it validates.
+    """
+    with span("llm.generate", "llm") as info:
+        code, _ = _llm_generate_function_code(nl_instructions, use_cache, info)
+    return code
+
+def _llm_generate_function_code(nl_instructions, use_cache, info):
+    """Return (code, cached), where cached says the code came from the disk cache."""
+    cache = get_cache() if use_cache else None
+    key = _generation_key(nl_instructions)
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            info["cache_hit"] = True
+            return cached, True
+
+    if use_cache and config.TEMPLATE_CACHE_ENABLED:
+        code = template_cache.lookup(nl_instructions)
+        if code is not None:
+            info["cache_hit"] = info["template_hit"] = True
+            return code, False
+    return _request_function_code(nl_instructions, info), False
+
+def _request_function_code(nl_instructions, info):
+    prompt = f"""
+You are an expert programmer. Convert the following natural language function instructions into a valid Python code snippet that implements them. 
+Do not include the function definition line (i.e. "def function_1():") or extra commentary—just the body code indented as needed. and take care of all imports.
+
+{GENERATION_RULES}Now, produce the Python code for the function:
 {nl_instructions}
 """
     try:
-        response = client.chat.completions.create(model="gpt-4",
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0)
-        code = response.choices[0].message.content.strip()
-        return code
+        return get_backend().complete(prompt, config.GENERATION_TEMPERATURE, info).text.strip()
     except Exception as e:
         print("Error during function code generation:", e)
         return "# Error generating code"
 
+def parse_batch_response(text):
+    """Extract the {function name: code} object from a batched generation response."""
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end < start:
+        raise ValueError("no JSON object in response")
+    codes = json.loads(text[start:end + 1])
+    if not isinstance(codes, dict):
+        raise ValueError("response is not a JSON object")
+    return codes
+
+def llm_generate_batch_code(named_instructions):
+    """
+    Generate code for several functions in one request. named_instructions is
+    a list of (function name, instructions) pairs. Returns {name: code} for the
+    entries the model answered with usable code; missing or malformed entries
+    are simply absent.
+    """
+    listing = "\n\n".join(f"### {name}\n{instructions}" for name, instructions in named_instructions)
+    example = json.dumps({"function_1": "import sqlite3\n...", "function_2": "print(function_1())"})
+    prompt = f"""
+You are an expert programmer. Convert each of the following natural language function instructions into a valid Python code snippet that implements them.
+For each function, do not include the function definition line (i.e. "def function_1():") or extra commentary—just the body code. and take care of all imports.
+
+{GENERATION_RULES}Now, produce the Python code for each of these functions:
+
+{listing}
+
+Respond with only a JSON object that maps each function name to its code body as a string, for example:
+{example}
+"""
+    with span("llm.generate_batch", "llm", functions=len(named_instructions)) as info:
+        completion = get_backend().complete(prompt, config.GENERATION_TEMPERATURE, info)
+    codes = parse_batch_response(completion.text)
+    return {
+        name: code.strip()
+        for name, code in codes.items()
+        if isinstance(code, str) and code.strip()
+    }
+
+def llm_repair_function_code(nl_instructions, generated_code, error):
+    """Ask for a corrected body for code that failed validation with error."""
+    prompt = f"""
+You are an expert programmer. The Python function body below was generated from these instructions:
+
+{nl_instructions}
+
+It is not valid:
+{error}
+
+{generated_code}
+
+{GENERATION_RULES}Respond with only the corrected body code, without the function definition line or commentary.
+"""
+    try:
+        with span("llm.repair", "llm") as info:
+            return get_backend().complete(prompt, config.GENERATION_TEMPERATURE, info).text.strip()
+    except Exception as e:
+        print("Error during function code repair:", e)
+        return "# Error generating code"
+
+def _ensure_valid(func, use_cache, store=False):
+    """
+    Validate func.generated_code, re-prompting with the error up to
+    config.REPAIR_ATTEMPTS times while it fails. Code that never validates is
+    replaced by a stub that raises when run, so it never reaches execution.
+    Code that validates is cached, and kept as the code for its template, if
+    it was repaired or if store is set because it was newly generated.
+    """
+    if func.generated_code.startswith("# Error"):
+        return
+    if not config.VALIDATION_ENABLED:
+        if store:
+            _store(func, use_cache)
+        return
+    with span("validate", "validate"):
+        error = validate_function_code(func.name, func.generated_code)
+    attempts = 0
+    while error is not None and attempts < config.REPAIR_ATTEMPTS:
+        attempts += 1
+        code = llm_repair_function_code(func.instructions, func.generated_code, error)
+        if code.startswith("# Error"):
+            break
+        func.generated_code = code
+        with span("validate", "validate"):
+            error = validate_function_code(func.name, code)
+    if error is None:
+        if store or attempts:
+            _store(func, use_cache)
+        return
+    print(f"Warning: {func.name} is still invalid after {attempts} repair attempt(s): {error}")
+    func.generated_code = invalid_function_stub(func.name, error)
+
+def _store(func, use_cache):
+    if not use_cache:
+        return
+    cache = get_cache()
+    if cache is not None:
+        cache.put(_generation_key(func.instructions), func.generated_code)
+    if config.TEMPLATE_CACHE_ENABLED:
+        template_cache.store(func.instructions, func.generated_code)
+
+def _finish(func, use_cache, on_generated, store=False):
+    _ensure_valid(func, use_cache, store)
+    if on_generated is not None:
+        on_generated(func)
+
+def _generate_one(func, use_cache, on_generated):
+    cached = False
+    # Functions sharing a template wait here until this one's code has been
+    # validated and stored, then reuse it.
+    with template_cache.claim(func.instructions) if use_cache and config.TEMPLATE_CACHE_ENABLED else nullcontext():
+        try:
+            with span("llm.generate", "llm") as info:
+                func.generated_code, cached = _llm_generate_function_code(func.instructions, use_cache, info)
+        except Exception as e:
+            print(f"Error during function code generation for {func.name}:", e)
+            func.generated_code = "# Error generating code"
+        _ensure_valid(func, use_cache, store=not cached)
+    if on_generated is not None:
+        on_generated(func)
+
+def _generate_batch(batch, use_cache, on_generated):
+    if len(batch) == 1:
+        _generate_one(batch[0], use_cache, on_generated)
+        return
+    try:
+        codes = llm_generate_batch_code([(func.name, func.instructions) for func in batch])
+    except Exception as e:
+        print("Error during batched code generation, retrying functions individually:", e)
+        codes = {}
+    for func in batch:
+        code = codes.get(func.name)
+        if code is None:
+            # Only the entries that failed are retried on their own.
+            _generate_one(func, use_cache, on_generated)
+            continue
+        func.generated_code = code
+        _finish(func, use_cache, on_generated, store=True)
+
+def _check_generated(futures, delivered, deliver):
+    """
+    Surface exceptions from generation tasks: every function of a task that
+    failed before its code was delivered becomes an error stub and is
+    delivered, so no caller is left waiting for it.
+    """
+    for future, funcs in futures:
+        try:
+            future.result()
+        except Exception as e:
+            print(f"Error during code generation for {', '.join(func.name for func in funcs)}:", e)
+            for func in funcs:
+                if id(func) not in delivered:
+                    func.generated_code = "# Error generating code"
+                    deliver(func)
+
+def generate_functions(functions, max_in_flight=None, use_cache=True, on_generated=None, batch_size=None):
+    """
+    Generate code for every FunctionDefinition concurrently, with at most
+    max_in_flight requests outstanding. Functions are submitted as the iterable
+    yields them and returned in document order; a failure in one function is
+    recorded as an error stub and does not affect the others.
+    on_generated(func), if given, is called from a worker thread as soon as
+    each function's code is ready.
+    With batch_size > 1, cache misses are packed into shared requests of up to
+    batch_size functions, split so each stays within the token budget.
+    Functions whose instructions share a template with one already being
+    generated wait for it and reuse its code with their own literals.
+    Every body is validated as it arrives and repaired if it fails (see
+    _ensure_valid) before on_generated sees it.
+    """
+    max_in_flight = max_in_flight or config.MAX_IN_FLIGHT
+    batch_size = batch_size or config.BATCH_SIZE
+    cache = get_cache() if use_cache else None
+    use_templates = use_cache and config.TEMPLATE_CACHE_ENABLED
+    submitted = []
+    batch, batch_tokens = [], 0
+    templates_requested, deferred = set(), []
+    generate_one = in_context(_generate_one)
+    generate_batch = in_context(_generate_batch)
+    finish = in_context(_finish)
+    futures = []
+    delivered = set()
+
+    def deliver(func):
+        delivered.add(id(func))
+        if on_generated is not None:
+            on_generated(func)
+
+    with span("generate"), ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        for func in functions:
+            submitted.append(func)
+            if batch_size <= 1:
+                futures.append((executor.submit(generate_one, func, use_cache, deliver), [func]))
+                continue
+            cached = None
+            if cache is not None:
+                with span("cache.lookup", "cache") as info:
+                    cached = cache.get(_generation_key(func.instructions))
+                    info["cache_hit"] = cached is not None
+            if cached is None and use_templates:
+                with span("template.lookup", "cache") as info:
+                    cached = template_cache.lookup(func.instructions)
+                    info["cache_hit"] = cached is not None
+            if cached is not None:
+                func.generated_code = cached
+                futures.append((executor.submit(finish, func, use_cache, deliver), [func]))
+                continue
+            if use_templates:
+                template, params = extract_template(func.instructions)
+                if params and template in templates_requested:
+                    deferred.append(func)
+                    continue
+                templates_requested.add(template)
+            tokens = estimate_tokens(func.instructions) * config.BATCH_CODE_EXPANSION
+            if batch and (len(batch) >= batch_size or batch_tokens + tokens > config.BATCH_TOKEN_BUDGET):
+                futures.append((executor.submit(generate_batch, batch, use_cache, deliver), batch))
+                batch, batch_tokens = [], 0
+            batch.append(func)
+            batch_tokens += tokens
+        if batch:
+            futures.append((executor.submit(generate_batch, batch, use_cache, deliver), batch))
+    _check_generated(futures, delivered, deliver)
+    if deferred:
+        # Their templates are known now; anything that still misses is generated on its own.
+        with span("generate.deferred"), ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+            futures = [(executor.submit(generate_one, func, use_cache, deliver), [func]) for func in deferred]
+        _check_generated(futures, delivered, deliver)
+    return submitted
+
 def llm_debug_suggestion(nl_instructions, error_message, generated_code):
     prompt = f"""
 You have received the following natural language function instructions:
@@ -98,10 +348,8 @@ However, when running the code an error occurred:
 What do you think might be wrong? Ask clarifying questions for details or suggest a correction. Respond in plain text.
 """
     try:
-        response = client.chat.completions.create(model="gpt-4",
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0.7)
-        suggestion = response.choices[0].message.content.strip()
+        with span("llm.debug", "llm") as info:
+            suggestion = get_backend().complete(prompt, config.DEBUG_TEMPERATURE, info).text.strip()
         return suggestion
     except Exception as e:
         print("Error during LLM debugging suggestion:", e)
@@ -0,0 +1,150 @@
+# language/profiler.py
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+
+
+class Profiler:
+    """
+    Collects timed spans across the compile/run pipeline (parsing, LLM calls,
+    code generation, compilation and each generated function) and exports them
+    as Chrome trace-event JSON or a text summary.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.events = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name, category="stage", **args):
+        """
+        Time the enclosed block. Yields a dict the block may add details to
+        (token counts, cache hits, ...), recorded with the span.
+        """
+        if not self.enabled:
+            yield {}
+            return
+        started_wall = time.time()
+        started = time.perf_counter()
+        try:
+            yield args
+        finally:
+            self.record(name, category, started_wall, time.perf_counter() - started, **args)
+
+    def record(self, name, category, start, duration, **args):
+        """Add a span that started at wall-clock time start and lasted duration seconds."""
+        if not self.enabled:
+            return
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": int(start * 1_000_000),
+            "dur": int(duration * 1_000_000),
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": args,
+        }
+        with self._lock:
+            self.events.append(event)
+
+    def extend(self, events):
+        """Merge events recorded elsewhere, e.g. in a worker process."""
+        with self._lock:
+            self.events.extend(events)
+
+    def chrome_trace(self):
+        with self._lock:
+            events = sorted(self.events, key=lambda event: event["ts"])
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def export_chrome_trace(self, path):
+        with open(path, "w") as f:
+            json.dump(self.chrome_trace(), f)
+
+    def summary(self):
+        """Aggregate spans by category and name, slowest total first."""
+        rows = {}
+        with self._lock:
+            events = list(self.events)
+        for event in events:
+            row = rows.setdefault((event["cat"], event["name"]), {
+                "category": event["cat"],
+                "name": event["name"],
+                "count": 0,
+                "total_ms": 0.0,
+                "max_ms": 0.0,
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+                "cache_hits": 0,
+            })
+            duration = event["dur"] / 1000
+            row["count"] += 1
+            row["total_ms"] += duration
+            row["max_ms"] = max(row["max_ms"], duration)
+            args = event["args"]
+            row["prompt_tokens"] += args.get("prompt_tokens") or 0
+            row["completion_tokens"] += args.get("completion_tokens") or 0
+            row["cache_hits"] += 1 if args.get("cache_hit") else 0
+        return sorted(rows.values(), key=lambda row: row["total_ms"], reverse=True)
+
+    def summary_table(self):
+        header = f"{'category':<10} {'name':<28} {'count':>6} {'total ms':>10} {'max ms':>10} {'tokens in/out':>15} {'cache hits':>10}"
+        lines = [header, "-" * len(header)]
+        for row in self.summary():
+            tokens = f"{row['prompt_tokens']}/{row['completion_tokens']}"
+            lines.append(
+                f"{row['category']:<10} {row['name'][:28]:<28} {row['count']:>6} "
+                f"{row['total_ms']:>10.1f} {row['max_ms']:>10.1f} {tokens:>15} {row['cache_hits']:>10}"
+            )
+        return "\n".join(lines)
+
+
+# The profiler the current thread/request records into. Disabled by default;
+# profiling() installs an enabled one for the duration of a block.
+_current = ContextVar("nature_profiler", default=Profiler())
+
+
+def get_profiler():
+    return _current.get()
+
+
+def span(name, category="stage", **args):
+    return get_profiler().span(name, category, **args)
+
+
+def traced(name, category="stage"):
+    """Decorator recording every call of the function as a span."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name, category):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+@contextmanager
+def profiling(profiler=None):
+    """Record every span inside the block, including work handed to threads via in_context, into profiler."""
+    profiler = profiler or Profiler(enabled=True)
+    token = _current.set(profiler)
+    try:
+        yield profiler
+    finally:
+        _current.reset(token)
+
+
+def in_context(fn):
+    """Wrap fn so worker threads run it with the caller's profiler."""
+    context = copy_context()
+
+    def run(*args, **kwargs):
+        # A context can only be entered by one thread at a time, so each call gets its own copy.
+        return context.copy().run(fn, *args, **kwargs)
+    return run
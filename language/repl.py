@@ -1,11 +1,18 @@
 # language/repl.py
 import sys
+import argparse
+from language import config, runtime
+from language.cache import get_cache
 from language.utils import load_nature_file, parse_nature_document
 from language.code_generator import generate_document_code
 from language.debugger import run_generated_code
-from language.parser import llm_generate_function_code
+from language.parser import generate_functions
 from language.ast import FunctionDefinition
 from language.importer import load_module
+from language.incremental import IncrementalBuilder, watch
+from language.artifact import artifact_functions, load_artifact, write_artifact
+from language.profiler import profiling, span
+from language.templates import template_cache
 
 
 def load_global_imports(import_list):
@@ -14,13 +21,77 @@ def load_global_imports(import_list):
         global_env[module_name] = load_module(module_name)
     return global_env
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run a Nature document.")
+    parser.add_argument("file", nargs="?", help="path to a .nature file (omit for REPL mode)")
+    parser.add_argument("--no-cache", action="store_true", help="bypass the generated code cache")
+    parser.add_argument("--clear-cache", action="store_true", help="empty the generated code cache before running")
+    parser.add_argument("--max-in-flight", type=int, default=None, help="maximum concurrent generation requests")
+    parser.add_argument("--batch-size", type=int, default=None, help="pack up to this many functions into one generation request")
+    parser.add_argument("--rebuild", action="store_true", help="ignore any compiled .naturec artifact and rebuild")
+    parser.add_argument("--resume", action="store_true", help="reuse checkpointed results and restart at the first failed function")
+    parser.add_argument("--checkpoint", action="store_true", help="checkpoint each function's result so a failed run can be resumed")
+    parser.add_argument("--watch", action="store_true", help="rebuild and re-run the file whenever it changes")
+    parser.add_argument("--profile", nargs="?", const="nature-trace.json", metavar="TRACE",
+                        help="time every stage and function; print a summary and write a Chrome trace (default nature-trace.json)")
+    parser.add_argument("--cache-stats", action="store_true", help="print cache hit/miss counters after generation")
+    parser.add_argument("--timeout", type=float, default=None, metavar="SECONDS",
+                        help="wall-clock limit per function (runs each function in a supervised subprocess)")
+    parser.add_argument("--cpu-limit", type=float, default=None, metavar="SECONDS", help="CPU time limit per function")
+    parser.add_argument("--memory-limit", type=int, default=None, metavar="MB", help="memory cap per function")
+    return parser.parse_args(argv)
+
 def main():
+    args = parse_args()
+    if not args.profile:
+        run_document(args)
+        return
+    with profiling() as profiler:
+        try:
+            run_document(args)
+        finally:
+            print("\n--- Profile ---")
+            print(profiler.summary_table())
+            profiler.export_chrome_trace(args.profile)
+            print(f"Chrome trace written to {args.profile} (open it in chrome://tracing or Perfetto)")
+
+def run_document(args):
+    if args.no_cache:
+        config.CACHE_ENABLED = False
+    if args.checkpoint:
+        runtime.CHECKPOINTS_ENABLED = True
+    if args.timeout is not None:
+        runtime.FUNCTION_TIMEOUT = args.timeout
+    if args.cpu_limit is not None:
+        runtime.FUNCTION_CPU_LIMIT = args.cpu_limit
+    if args.memory_limit is not None:
+        runtime.FUNCTION_MEMORY_LIMIT = args.memory_limit
+    cache = get_cache()
+    if args.clear_cache and cache is not None:
+        cache.clear()
+        print("Generated code cache cleared.")
+
+    if args.watch:
+        if not args.file:
+            print("--watch requires a .nature file.")
+            sys.exit(1)
+        builder = IncrementalBuilder(max_in_flight=args.max_in_flight, use_cache=not args.no_cache)
+        watch(args.file, run_generated_code, builder)
+        return
+
     # Load instructions from a file if provided; otherwise, use REPL mode.
-    if len(sys.argv) > 1:
-        file_path = sys.argv[1]
+    file_path = None
+    if args.file:
+        file_path = args.file
+        payload = None if args.rebuild else load_artifact(file_path)
+        if payload is not None:
+            print(f"\n--- Running compiled artifact for {file_path} ---")
+            run_generated_code(payload["code"], artifact_functions(payload), resume=args.resume)
+            return
         if not file_path.endswith(".nature"):
             print("Warning: It is recommended to use a '.nature' extension for natural language files.")
-        document_text = load_nature_file(file_path)
+        with span("load"):
+            document_text = load_nature_file(file_path)
     else:
         print("Enter your natural language instructions. Use 'function:' to start a function block,")
         print("and type 'run' (on a new line) to execute.")
@@ -46,17 +117,25 @@ def main():
         print(func)
     
     # Generate code for each function using the LLM.
-    for func in functions:
-        func.generated_code = llm_generate_function_code(func.instructions)
+    generate_functions(functions, max_in_flight=args.max_in_flight, batch_size=args.batch_size)
+    if args.cache_stats and cache is not None:
+        print("\n--- Cache Stats ---")
+        print(cache.stats())
+        print("templates:", template_cache.stats())
 
     # Generate the full Python code for the document.
     full_code = generate_document_code(functions)
     print("\n--- Generated Python Code ---")
     print(full_code)
-    
+
+    # Save a compiled artifact so the next run can skip generation entirely.
+    if file_path and not any(func.generated_code.startswith("# Error") for func in functions):
+        with span("artifact"):
+            full_code = write_artifact(file_path, full_code, functions)
+
     # Execute the generated code.
     print("\n--- Executing Generated Code ---")
-    run_generated_code(full_code, functions)
+    run_generated_code(full_code, functions, resume=args.resume)
 
 if __name__ == "__main__":
     main()
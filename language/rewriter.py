@@ -0,0 +1,343 @@
+# language/rewriter.py
+import ast
+import collections
+import io
+import os
+import re
+import sys
+import textwrap
+import token
+import tokenize
+
+# Lines of model commentary that sometimes surround the generated code.
+PROSE_PREFIXES = ("It's not clear", "Without more context", "However", "If", "```", "Output:")
+
+# Before 3.12 an f-string is a single STRING token, so module references inside
+# its replacement fields are invisible to the token pass.
+FSTRINGS_ARE_TOKENIZED = sys.version_info >= (3, 12)
+FSTRING_PREFIX = re.compile(r"^[rbuRBU]*[fF]")
+
+SKIP_TOKENS = {tokenize.NL, tokenize.COMMENT, tokenize.INDENT, tokenize.DEDENT}
+STATEMENT_START_TOKENS = {tokenize.NEWLINE, tokenize.ENCODING}
+
+# A token with start and end as offsets into the source.
+Token = collections.namedtuple("Token", "type string start end")
+
+# One match per token, with the whitespace and line continuations before it;
+# the most common tokens come first. Covers the code models write: anything
+# else is an "error" match, and _scan gives up.
+TOKEN_PATTERN = re.compile(
+    r"[ \t\f]*(?:\\\r?\n[ \t\f]*)*(?:"
+    r"(?P<name>(?![rRbBuUfF]{1,2}['\"])[^\W\d]\w*)"
+    r"|(?P<op>\.\.\.|\.(?!\d)|\*\*=|//=|>>=|<<=|->|:=|\*\*|//|>>|<<|[-+*/%&|^@=<>!]=|[-+*/%&|^@~<>=,:;()\[\]{}])"
+    r"|(?P<string>[rRbBuUfF]{0,2}(?:"
+    r"'''[^'\\]*(?:(?:\\[\s\S]|'(?!''))[^'\\]*)*'''"
+    r'|"""[^"\\]*(?:(?:\\[\s\S]|"(?!""))[^"\\]*)*"""'
+    r"|'[^'\\\r\n]*(?:\\[\s\S][^'\\\r\n]*)*'"
+    r'|"[^"\\\r\n]*(?:\\[\s\S][^"\\\r\n]*)*"'
+    r"))"
+    r"|(?P<newline>\r?\n)"
+    r"|(?P<number>0[xX](?:_?[0-9a-fA-F])+|0[bB](?:_?[01])+|0[oO](?:_?[0-7])+"
+    r"|(?:\d(?:_?\d)*(?:\.(?:\d(?:_?\d)*)?)?|\.\d(?:_?\d)*)(?:[eE][+-]?\d(?:_?\d)*)?[jJ]?)"
+    r"|(?P<comment>#[^\r\n]*)"
+    r"|(?P<error>[^ \t\f])"
+    r")"
+)
+
+# Objects the runtime puts in the generated program's globals. Using one of
+# them (db.connect(...)) counts as changing global_env[name], so functions
+# that share it run in document order.
+RUNTIME_SERVICES = {"db"}
+# Dicts shared by every function. Their literal keys are tracked like global
+# variables; global_context keys are recorded as state_key("global_context", key).
+SHARED_STATE = {"global_env", "global_context"}
+# The program's output is shared like a file: functions that print, read
+# input or touch sys.stdout/stderr/stdin use it, so their output keeps
+# document order while everything else runs concurrently.
+OUTPUT_RESOURCE = "<stdout>"
+OUTPUT_NAMES = {"print", "pprint", "input"}
+STANDARD_STREAMS = {"stdout", "stderr", "stdin"}
+# The names rewrite() looks at, besides module names and function_N.
+REWRITE_NAMES = SHARED_STATE | RUNTIME_SERVICES | OUTPUT_NAMES | {"sys", "function", "previous_function"}
+ASSIGNMENT_OPS = {"=", "+=", "-=", "*=", "/=", "//=", "%=", "**=", "|=", "&=", "^=", ">>=", "<<=", "@="}
+
+# String literals that look like paths (a name with a file extension, or
+# anything with a directory separator) name files several functions may share.
+# A literal that merely looks like a path only costs some concurrency.
+RESOURCE_LITERAL = re.compile(
+    r"""^[rbuRBU]*(['"])([\w.\\/~-]*\w\.[A-Za-z][A-Za-z0-9]{0,7}|(?=[^'"]*\w)[\w.~-]*[\\/][\w.\\/~-]*)\1$"""
+)
+
+
+def clean_body(code):
+    """Drop model commentary and code fences, and remove common indentation."""
+    lines = [line for line in code.split("\n") if not line.strip().startswith(PROSE_PREFIXES)]
+    return textwrap.dedent("\n".join(lines).strip("\n"))
+
+
+class FunctionBody:
+    """
+    A generated function body, tokenized once. Records the plain
+    `import module` statements it contains so they can be hoisted into the
+    module manager, and rewrites module and cross-function references in a
+    single pass over the tokens. String literals and comments are never touched.
+    """
+
+    def __init__(self, code):
+        self.source = clean_body(code or "")
+        self.imports = set()
+        self.attribute_bases = set()  # names used as `name.attr`, e.g. modules used without an import
+        self._import_spans = []  # (start, end, modules) of removable import statements
+        self._import_statements = {}  # first token index -> end index of every import statement
+        self._fstrings = []
+        self.tokens = _scan(self.source)
+        if self.tokens is None:
+            try:
+                self.tokens = _tokenize(self.source)
+            except (tokenize.TokenError, IndentationError, SyntaxError):
+                # Not valid Python; leave it for the compiler to report.
+                return
+        self._scan_imports()
+
+    def _scan_imports(self):
+        tokens = self.tokens
+        strings = [tok.string for tok in tokens]
+        if not FSTRINGS_ARE_TOKENIZED:
+            self._fstrings = [
+                tok.string for tok in tokens if tok.type == token.STRING and FSTRING_PREFIX.match(tok.string)
+            ]
+        self.attribute_bases = {
+            strings[i - 1] for i, text in enumerate(strings)
+            if text == "." and i and tokens[i - 1].type == token.NAME and (i == 1 or strings[i - 2] != ".")
+        }
+        for i in [i for i, text in enumerate(strings) if text == "import" or text == "from"]:
+            if i and tokens[i - 1].type not in STATEMENT_START_TOKENS and strings[i - 1] != ";":
+                continue
+            end = i
+            while tokens[end].type not in (tokenize.NEWLINE, token.ENDMARKER) and strings[end] != ";":
+                end += 1
+            self._import_statements[i] = end
+            if strings[i] == "from":
+                continue
+            names = strings[i + 1:end]
+            modules = set("".join(names).split(","))
+            # Statements with aliases stay in place so the alias is bound locally,
+            # and so do dotted imports, which also load the submodule.
+            if "as" not in names and all(m.isidentifier() for m in modules):
+                self.imports.update(modules)
+                self._import_spans.append((tokens[i].start, tokens[end].start, modules))
+
+    def rewrite(self, index, module_names):
+        """
+        Return the body with hoisted imports removed, `module.` references
+        turned into global_env['module'] lookups and references to earlier
+        functions (function_N(), previous_function(), "function N",
+        "function before this one") turned into their stored results.
+        index is the 0-based position of this function in the document.
+        """
+        # What the rewritten body touches, for the dependency graph.
+        self.env_reads = set()
+        self.env_writes = set()
+        self.resources = set()
+        self.dynamic_env = self.tokens is None
+        if self.tokens is None:
+            return self.source
+
+        edits = []
+        for start, end, modules in self._import_spans:
+            if not any(self._in_fstring(module) for module in modules):
+                edits.append((start, end, "pass"))
+
+        previous_ref = f"global_env['function_{index}']"
+        tokens = self.tokens
+        count = len(tokens)
+        i = 0
+        while i < count:
+            if i in self._import_statements:
+                i = self._import_statements[i]
+                continue
+            tok = tokens[i]
+            if tok.type == token.STRING:
+                match = RESOURCE_LITERAL.match(tok.string)
+                if match:
+                    self.resources.add(os.path.normpath(match.group(2)))
+            if tok.type != token.NAME:
+                i += 1
+                continue
+            name = tok.string
+            if name not in REWRITE_NAMES and name not in module_names and not name.startswith("function_"):
+                i += 1
+                continue
+            after = tokens[i + 1].string if i + 1 < count else ""
+            before = tokens[i - 1].string if i > 0 else ""
+            if name in SHARED_STATE and before != ".":
+                self._record_env_access(i)
+            elif name in RUNTIME_SERVICES and after == "." and before != ".":
+                self.env_reads.add(name)
+                self.env_writes.add(name)
+            if before != "." and (name in OUTPUT_NAMES or name == "sys" and after == "." and i + 2 < count
+                                  and tokens[i + 2].string in STANDARD_STREAMS):
+                self.resources.add(OUTPUT_RESOURCE)
+            span_end = None
+            replacement = None
+
+            if name in module_names and after == "." and before != ".":
+                replacement = f"global_env['{name}']"
+                span_end = tok.end
+            elif before != "." and after == "(" and i + 2 < count and tokens[i + 2].string == ")":
+                number = _function_number(name)
+                if number is not None and number <= index:
+                    replacement = f"global_env['{name}']"
+                elif name == "previous_function" and index > 0:
+                    replacement = previous_ref
+                if replacement is not None:
+                    span_end = tokens[i + 2].end
+            elif name == "function" and before != ".":
+                if tokens[i + 1].type == token.NUMBER and tokens[i + 1].string.isdigit() \
+                        and 1 <= int(tokens[i + 1].string) <= index:
+                    replacement = f"global_env['function_{int(tokens[i + 1].string)}']"
+                    span_end = tokens[i + 1].end
+                elif index > 0 and [t.string for t in tokens[i + 1:i + 4]] == ["before", "this", "one"]:
+                    replacement = previous_ref
+                    span_end = tokens[i + 3].end
+
+            if replacement is None:
+                i += 1
+                continue
+            if replacement.startswith("global_env['function_"):
+                self.env_reads.add(replacement[12:-2])
+            edits.append((tok.start, span_end, replacement))
+            while i < count and tokens[i].end <= span_end:
+                i += 1
+
+        return _apply_edits(self.source, edits)
+
+    def _record_env_access(self, i):
+        """
+        Classify global_env[...] or global_context[...] at token i as a read or
+        write of a literal key. Any other use of them is a barrier.
+        """
+        tokens = self.tokens
+        container = tokens[i].string
+        if i + 3 < len(tokens) and tokens[i + 1].string == "[" and tokens[i + 2].type == token.STRING \
+                and tokens[i + 3].string == "]":
+            try:
+                key = ast.literal_eval(tokens[i + 2].string)
+            except (ValueError, SyntaxError):
+                key = None
+            if isinstance(key, str):
+                if container != "global_env":
+                    key = state_key(container, key)
+                following = tokens[i + 4].string if i + 4 < len(tokens) else ""
+                self.env_reads.add(key)
+                # Assigning to it, or calling methods on / indexing into it, may mutate it.
+                if following in ASSIGNMENT_OPS or following in (".", "["):
+                    self.env_writes.add(key)
+                return
+        self.dynamic_env = True
+
+    def _in_fstring(self, module):
+        pattern = re.compile(r"(?<![\w.])" + re.escape(module) + r"\.")
+        return any(pattern.search(s) for s in self._fstrings)
+
+
+def _scan(source):
+    """
+    The tokens of source, as tokenize would produce them without comments,
+    blank lines and indentation, but several times faster. Returns None for
+    anything it doesn't handle (unknown characters, unterminated strings or
+    brackets, f-strings where tokenize splits them), so the caller can fall
+    back to _tokenize.
+    """
+    tokens = []
+    append = tokens.append
+    make = tuple.__new__
+    depth = 0
+    newline = True  # at the start of a logical line
+    for match in TOKEN_PATTERN.finditer(source):
+        kind = match.lastgroup
+        start, end = match.span(kind)
+        if kind == "name":
+            append(make(Token, (token.NAME, source[start:end], start, end)))
+        elif kind == "op":
+            text = source[start:end]
+            if text in "([{":
+                depth += 1
+            elif text in ")]}":
+                depth -= 1
+                if depth < 0:
+                    return None
+            append(make(Token, (token.OP, text, start, end)))
+        elif kind == "newline":
+            if not depth and not newline:
+                append(make(Token, (tokenize.NEWLINE, source[start:end], start, end)))
+                newline = True
+            continue
+        elif kind == "string":
+            text = source[start:end]
+            if FSTRINGS_ARE_TOKENIZED and FSTRING_PREFIX.match(text):
+                return None
+            append(make(Token, (token.STRING, text, start, end)))
+        elif kind == "number":
+            append(make(Token, (token.NUMBER, source[start:end], start, end)))
+        elif kind == "error":
+            return None
+        else:
+            continue
+        newline = False
+    if depth:
+        return None
+    end = len(source)
+    if not newline:
+        append(Token(tokenize.NEWLINE, "", end, end + 1))
+    append(Token(token.ENDMARKER, "", end, end))
+    return tokens
+
+
+def _tokenize(source):
+    """The tokens of source from tokenize, in the form _scan returns. Raises for invalid code."""
+    line_offsets = [0]
+    for line in source.splitlines(keepends=True):
+        line_offsets.append(line_offsets[-1] + len(line))
+    return [
+        Token(tok.type, tok.string, line_offsets[tok.start[0] - 1] + tok.start[1],
+              line_offsets[tok.end[0] - 1] + tok.end[1])
+        for tok in tokenize.generate_tokens(io.StringIO(source).readline)
+        if tok.type not in SKIP_TOKENS
+    ]
+
+
+def state_key(container, key):
+    """How a key of a shared dict other than global_env is recorded in env_reads/env_writes."""
+    return f"{container}[{key!r}]"
+
+
+def parse_state_key(key):
+    """(container, key) for a recorded key: ("global_env", key) unless it came from state_key."""
+    container, bracket, rest = key.partition("[")
+    if bracket and container in SHARED_STATE and rest.endswith("]"):
+        try:
+            return container, ast.literal_eval(rest[:-1])
+        except (ValueError, SyntaxError):
+            pass
+    return "global_env", key
+
+
+def _function_number(name):
+    if name.startswith("function_") and name[9:].isdigit():
+        return int(name[9:])
+    return None
+
+
+def _apply_edits(source, edits):
+    if not edits:
+        return source
+    edits.sort()
+    parts = []
+    position = 0
+    for start, end, replacement in edits:
+        parts.append(source[position:start])
+        parts.append(replacement)
+        position = end
+    parts.append(source[position:])
+    return "".join(parts)
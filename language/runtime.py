@@ -0,0 +1,836 @@
+# language/runtime.py
+# Support code imported by the programs that generate_document_code emits.
+import ctypes
+import heapq
+import importlib
+import math
+import os
+import pickle
+import select
+import signal
+import sqlite3
+import sys
+import threading
+import time
+import traceback
+import types
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+try:
+    import resource
+except ImportError:  # not available on Windows, where functions are never forked
+    resource = None
+from language.profiler import get_profiler, in_context, span
+
+
+# Functions run on several threads; each status line is written whole under
+# this lock so lines from different functions don't interleave.
+_report_lock = threading.Lock()
+
+
+def report(text, stream=None):
+    stream = stream or sys.stdout
+    with _report_lock:
+        stream.write(text + "\n")
+        stream.flush()
+
+
+def default_max_workers():
+    return int(os.environ.get("NATURE_MAX_WORKERS", 0)) or min(32, (os.cpu_count() or 1) + 4)
+
+
+# Set by run_generated_code(resume=True) or NATURE_RESUME=1: reuse checkpointed
+# results instead of re-running functions that already succeeded.
+RESUME = bool(os.environ.get("NATURE_RESUME"))
+# Checkpoints are only written when asked for (NATURE_CHECKPOINTS=1 or the
+# REPL's --checkpoint) and when resuming, so ordinary runs leave nothing behind.
+CHECKPOINTS_ENABLED = bool(os.environ.get("NATURE_CHECKPOINTS"))
+# NATURE_IMPORT_TIMES=1 reports how long each module took to import as it loads.
+SHOW_IMPORT_TIMES = bool(os.environ.get("NATURE_IMPORT_TIMES"))
+# Per-function limits (0 means none): wall-clock seconds, CPU seconds, and
+# megabytes of memory on top of what the program already uses. With any of
+# them set, each function runs in a supervised child process.
+FUNCTION_TIMEOUT = float(os.environ.get("NATURE_FUNCTION_TIMEOUT", 0))
+FUNCTION_CPU_LIMIT = float(os.environ.get("NATURE_FUNCTION_CPU_LIMIT", 0))
+FUNCTION_MEMORY_LIMIT = int(os.environ.get("NATURE_FUNCTION_MEMORY_MB", 0))
+
+
+class InvalidFunctionError(RuntimeError):
+    """Raised by the stub that replaces generated code which never validated."""
+
+
+class _TimedOut(BaseException):
+    """
+    Raised asynchronously in a function thread whose deadline has passed. A
+    BaseException, so the function's own `except Exception` can't swallow it.
+    """
+
+
+class _ChildTraceback(Exception):
+    """Carries a supervised child's traceback as the __cause__ of the exception it raised."""
+
+    def __init__(self, text):
+        super().__init__(text)
+        self.text = text
+
+    def __str__(self):
+        return f"in the supervised process:\n{self.text}"
+
+
+class FunctionLimitError(RuntimeError):
+    """A function ran past its wall-clock timeout, CPU time limit or memory cap."""
+
+
+class LazyModule(types.ModuleType):
+    """
+    Stands in for a module in global_env until one of its attributes is used,
+    then imports it and replaces itself in global_env with the real module.
+    """
+
+    def __init__(self, name, manager):
+        super().__init__(name)
+        object.__setattr__(self, "_manager", manager)
+        object.__setattr__(self, "_module", None)
+
+    def _load(self):
+        module = object.__getattribute__(self, "_module")
+        if module is None:
+            module = object.__getattribute__(self, "_manager").import_module(self.__name__)
+            object.__setattr__(self, "_module", module)
+        return module
+
+    def __getattr__(self, attribute):
+        return getattr(self._load(), attribute)
+
+    def __setattr__(self, attribute, value):
+        setattr(self._load(), attribute, value)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = "loaded" if object.__getattribute__(self, "_module") is not None else "not loaded"
+        return f"<lazy module {self.__name__!r} ({state})>"
+
+
+class ModuleManager:
+    """
+    Provides the modules the generated functions import. load_module only
+    installs a LazyModule, so a module is imported when a function first uses
+    it rather than before anything runs. import_times records how long each
+    import took, in seconds.
+    """
+
+    def __init__(self):
+        self.global_env = {}
+        self.loaded_modules = set()
+        self.import_times = {}
+        self._lock = threading.Lock()
+        self._import_locks = {}
+
+    def load_module(self, name):
+        if name not in self.loaded_modules and name not in self.global_env:
+            self.global_env[name] = sys.modules.get(name) or LazyModule(name, self)
+
+    def import_module(self, name):
+        # One lock per module, so a slow import doesn't hold up unrelated ones.
+        with self._lock:
+            lock = self._import_locks.setdefault(name, threading.Lock())
+        with lock:
+            if name in self.loaded_modules:
+                return sys.modules[name]
+            started = time.perf_counter()
+            try:
+                with span(f"import {name}", "import"):
+                    module = importlib.import_module(name)
+            except ImportError as e:
+                raise ImportError(f"Could not load module {name}: {e}") from None
+            elapsed = time.perf_counter() - started
+            self.import_times[name] = elapsed
+            self.loaded_modules.add(name)
+            self.global_env[name] = module
+        if SHOW_IMPORT_TIMES:
+            report(f"Imported {name} in {elapsed * 1000:.1f} ms", stream=sys.stderr)
+        return module
+
+
+# Names with one of these suffixes (or a directory part) are database files;
+# any other name is an in-memory database that lives as long as the program.
+DATABASE_FILE_SUFFIXES = (".db", ".sqlite", ".sqlite3")
+
+
+class DatabasePool:
+    """
+    Shared SQLite connections for the generated functions, available as `db`
+    and global_env['db']. Each database name gets one connection that every
+    function reuses, so tables created in one function are visible in the
+    next, even in memory. File databases use WAL mode, and each connection
+    keeps a cache of prepared statements.
+    """
+
+    def __init__(self, directory=None, cached_statements=512):
+        self.directory = directory or os.environ.get("NATURE_DB_DIR") or os.getcwd()
+        self.cached_statements = cached_statements
+        self._connections = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def path(self, name):
+        if name == ":memory:" or not (name.endswith(DATABASE_FILE_SUFFIXES) or os.sep in name):
+            return ":memory:"
+        return os.path.join(self.directory, name)
+
+    def connect(self, name="main"):
+        """The shared connection for database name ("main" and plain names are in memory, "x.db" is a file)."""
+        with self._lock:
+            conn = self._connections.get(name)
+            if conn is None:
+                path = self.path(name)
+                conn = sqlite3.connect(path, check_same_thread=False, cached_statements=self.cached_statements)
+                if path != ":memory:":
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.execute("PRAGMA synchronous=NORMAL")
+                    conn.execute("PRAGMA busy_timeout=5000")
+                self._connections[name] = conn
+                self._locks[name] = threading.RLock()
+            return conn
+
+    def execute(self, sql, parameters=(), database="main"):
+        """Run one statement and commit it; returns the cursor."""
+        conn = self.connect(database)
+        with self._locks[database], conn:
+            return conn.execute(sql, parameters)
+
+    def query(self, sql, parameters=(), database="main"):
+        """Run a query and return all its rows."""
+        conn = self.connect(database)
+        with self._locks[database]:
+            return conn.execute(sql, parameters).fetchall()
+
+    def bulk_insert(self, table, rows, columns=None, database="main"):
+        """
+        Insert rows (tuples, or dicts keyed by column) into table with one
+        executemany in a single transaction. Returns the number of rows.
+        """
+        rows = list(rows)
+        if not rows:
+            return 0
+        if columns is None and isinstance(rows[0], dict):
+            columns = list(rows[0])
+        if isinstance(rows[0], dict):
+            rows = [tuple(row[column] for column in columns) for row in rows]
+        width = len(columns) if columns else len(rows[0])
+        column_list = f" ({', '.join(_quote_identifier(c) for c in columns)})" if columns else ""
+        sql = f"INSERT INTO {_quote_identifier(table)}{column_list} VALUES ({', '.join('?' * width)})"
+        conn = self.connect(database)
+        with self._locks[database], conn:
+            conn.executemany(sql, rows)
+        return len(rows)
+
+    def interrupt(self):
+        """Abort the statement each connection is running; it raises sqlite3.OperationalError."""
+        with self._lock:
+            for conn in self._connections.values():
+                conn.interrupt()
+
+    def close(self):
+        with self._lock:
+            for conn in self._connections.values():
+                conn.close()
+            self._connections.clear()
+            self._locks.clear()
+
+
+def _quote_identifier(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+class CheckpointStore:
+    """
+    Saves each successful function's result under a key derived from its code
+    and the keys of its upstream functions, so a result is only reused when
+    nothing it depends on has changed. Results that can't be pickled are kept
+    as a reference to the file they point at when there is one. state holds
+    the global_env entries the function wrote, restored along with the result.
+    """
+
+    def __init__(self, directory=None, max_bytes=None, max_age=None):
+        from language import config
+
+        self.directory = directory or config.CACHE_DIR / "checkpoints"
+        self.max_bytes = max_bytes or config.CHECKPOINT_MAX_BYTES
+        self.max_age = max_age or config.CHECKPOINT_MAX_AGE
+
+    def evict(self):
+        """Drop expired checkpoints, then least recently used ones until under max_bytes."""
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        entries = []
+        for name in names:
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        cutoff = time.time() - self.max_age
+        total = sum(size for _, size, _ in entries)
+        for mtime, size, path in entries:
+            if mtime >= cutoff and total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.pkl")
+
+    def save(self, key, value, state=None):
+        state = state or {}
+        try:
+            pickle.dumps(state)
+        except Exception:
+            return False
+        try:
+            data = pickle.dumps(("value", value, state))
+        except Exception:
+            path = getattr(value, "name", None) if not hasattr(value, "__fspath__") else os.fspath(value)
+            if not isinstance(path, str) or not os.path.exists(path):
+                return False
+            stat = os.stat(path)
+            data = pickle.dumps(("path", (os.path.abspath(path), stat.st_mtime_ns, stat.st_size), state))
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{self._path(key)}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self._path(key))
+        return True
+
+    def load(self, key):
+        """Return (True, value, state) for a usable checkpoint, else (False, None, None)."""
+        try:
+            with open(self._path(key), "rb") as f:
+                kind, value, state = pickle.load(f)
+            os.utime(self._path(key))  # mark it recently used for evict()
+        except Exception:
+            return False, None, None
+        if kind == "path":
+            path, mtime, size = value
+            try:
+                stat = os.stat(path)
+            except OSError:
+                return False, None, None
+            if (stat.st_mtime_ns, stat.st_size) != (mtime, size):
+                return False, None, None
+            return True, path, state
+        return True, value, state
+
+
+def limits_enabled():
+    return hasattr(os, "fork") and resource is not None and bool(FUNCTION_TIMEOUT or FUNCTION_CPU_LIMIT or FUNCTION_MEMORY_LIMIT)
+
+
+def _code_names(code):
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            names |= _code_names(const)
+    return names
+
+
+def uses_database(func):
+    """Whether func reads the shared `db` pool, whose connections can't cross a fork."""
+    return "db" in _code_names(func.__code__)
+
+
+def _write_frame(fd, tag, data):
+    data = tag + f"{len(data):08x}".encode("ascii") + data
+    while data:
+        data = data[os.write(fd, data):]
+
+
+class _FrameWriter:
+    """Text stream sending everything written to it to the supervisor as frames of one tag."""
+
+    def __init__(self, fd, tag, lock):
+        self.fd = fd
+        self.tag = tag
+        self.lock = lock
+
+    def write(self, text):
+        if text:
+            with self.lock:
+                _write_frame(self.fd, self.tag, text.encode("utf-8"))
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+def _apply_limits():
+    if FUNCTION_CPU_LIMIT:
+        seconds = math.ceil(FUNCTION_CPU_LIMIT)
+        # SIGXCPU at the soft limit, SIGKILL a second later if it is ignored.
+        resource.setrlimit(resource.RLIMIT_CPU, (seconds, seconds + 1))
+    if FUNCTION_MEMORY_LIMIT:
+        try:
+            with open("/proc/self/statm") as f:
+                in_use = int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError):
+            in_use = 0
+        _, hard = resource.getrlimit(resource.RLIMIT_AS)
+        limit = in_use + FUNCTION_MEMORY_LIMIT * 1024 * 1024
+        if hard != resource.RLIM_INFINITY:
+            limit = min(limit, hard)
+        resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+
+
+def _snapshot(global_env):
+    """Pickled copies of the global_env values, to tell later which ones a function changed."""
+    snapshot = {}
+    for key, value in global_env.items():
+        if isinstance(value, types.ModuleType):
+            continue
+        try:
+            snapshot[key] = pickle.dumps(value)
+        except Exception:
+            snapshot[key] = None  # never sent back, and not worth a warning
+    return snapshot
+
+
+def _changed_entries(global_env, snapshot):
+    """
+    The global_env entries a function assigned or mutated in place, pickled,
+    to copy back to the parent. Modules it imported are left out (the parent
+    imports them itself when needed), as are values that can't be pickled.
+    """
+    changes = {}
+    for key, value in global_env.items():
+        if isinstance(value, types.ModuleType):
+            continue
+        try:
+            data = pickle.dumps(value)
+        except Exception as e:
+            if key not in snapshot:
+                print(f"Warning: global_env[{key!r}] can't be sent back from the supervised process: {e}", file=sys.stderr)
+            continue
+        if snapshot.get(key) != data:
+            changes[key] = data
+    return changes
+
+
+def _merge_change(global_env, key, value):
+    """
+    Store a value sent back by a supervised child. Containers are updated in
+    place, so other references to them (global_context, for one) see the change.
+    """
+    current = global_env.get(key)
+    if type(current) is type(value) and isinstance(value, (dict, set)):
+        current.clear()
+        current.update(value)
+    elif type(current) is type(value) and isinstance(value, list):
+        current[:] = value
+    else:
+        global_env[key] = value
+
+
+def _run_child(func, global_env, fd):
+    """Body of the forked child: run func under the limits and report back. Never returns."""
+    lock = threading.Lock()
+    sys.stdout = _FrameWriter(fd, b"o", lock)
+    sys.stderr = _FrameWriter(fd, b"e", lock)
+    try:
+        try:
+            _apply_limits()
+            snapshot = _snapshot(global_env)
+            result = func()
+            changes = _changed_entries(global_env, snapshot)
+            try:
+                outcome = pickle.dumps(("ok", result, changes))
+            except Exception as e:
+                raise TypeError(f"its result can't be sent back from the supervised process: {e}") from None
+        except MemoryError:
+            message = f"{func.__name__} exceeded its memory limit of {FUNCTION_MEMORY_LIMIT} MB"
+            outcome = pickle.dumps(("limit", message, None))
+        except BaseException as e:
+            details = traceback.format_exc()
+            try:
+                outcome = pickle.dumps(("error", e, details))
+            except Exception:
+                outcome = pickle.dumps(("error", RuntimeError(f"{type(e).__name__}: {e}"), details))
+        _write_frame(fd, b"r", outcome)
+    finally:
+        os._exit(0)
+
+
+class SupervisedRun:
+    """
+    One function running in a forked child under the configured limits. The
+    supervisor selects on it, calls read() when it is readable, kill() once
+    its deadline passes, and result() when it is done.
+    """
+
+    def __init__(self, func, global_env, inherited_fds=()):
+        self.name = func.__name__
+        read_fd, write_fd = os.pipe()
+        sys.stdout.flush()
+        sys.stderr.flush()
+        # Threads running `db` functions may be reporting; don't fork mid-line.
+        with _report_lock:
+            pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            for fd in inherited_fds:  # the other children's pipes
+                os.close(fd)
+            _run_child(func, global_env, write_fd)
+        os.close(write_fd)
+        self.pid = pid
+        self.fd = read_fd
+        self.started_wall = time.time()
+        self.started = time.monotonic()
+        self.deadline = self.started + FUNCTION_TIMEOUT if FUNCTION_TIMEOUT else None
+        self.done = False
+        self.timed_out = False
+        self._buffer = b""
+        self._outcome = None
+
+    def fileno(self):
+        return self.fd
+
+    def read(self):
+        """Pass on the output the child has written; done once its result (or EOF) arrives."""
+        chunk = os.read(self.fd, 65536)
+        if not chunk:
+            self.done = True
+            return
+        self._buffer += chunk
+        while len(self._buffer) >= 9:
+            length = int(self._buffer[1:9], 16)
+            if len(self._buffer) < 9 + length:
+                break
+            tag, data = self._buffer[:1], self._buffer[9:9 + length]
+            self._buffer = self._buffer[9 + length:]
+            if tag == b"o":
+                sys.stdout.write(data.decode("utf-8", errors="replace"))
+            elif tag == b"e":
+                sys.stderr.write(data.decode("utf-8", errors="replace"))
+            elif tag == b"r":
+                self._outcome = pickle.loads(data)
+                self.done = True
+                return
+
+    def kill(self):
+        os.kill(self.pid, signal.SIGKILL)
+        self.timed_out = self.done = True
+
+    def result(self, global_env):
+        """
+        Reap the child and return its result, copying back the global_env
+        entries it changed. Raises what the function raised, or
+        FunctionLimitError if it broke a limit.
+        """
+        os.close(self.fd)
+        _, status = os.waitpid(self.pid, 0)
+        get_profiler().record(self.name, "function", self.started_wall, time.monotonic() - self.started, supervised=True)
+        name = self.name
+        if self.timed_out:
+            raise FunctionLimitError(f"{name} timed out after {FUNCTION_TIMEOUT:g}s")
+        if self._outcome is None:
+            if os.WIFSIGNALED(status) and os.WTERMSIG(status) in (signal.SIGXCPU, signal.SIGKILL) and FUNCTION_CPU_LIMIT:
+                raise FunctionLimitError(f"{name} exceeded its CPU time limit of {FUNCTION_CPU_LIMIT:g}s")
+            if os.WIFSIGNALED(status):
+                raise RuntimeError(f"{name} was killed by {signal.Signals(os.WTERMSIG(status)).name}")
+            raise RuntimeError(f"{name} exited without reporting a result")
+        kind, value, extra = self._outcome
+        if kind == "limit":
+            raise FunctionLimitError(value)
+        if kind == "error":
+            raise value from _ChildTraceback(extra.rstrip())
+        for key, data in extra.items():
+            _merge_change(global_env, key, pickle.loads(data))
+        return value
+
+
+class ThreadedRun:
+    """
+    A function that uses `db`, whose connections can't cross a fork, running
+    on its own thread under the supervisor. Only the wall-clock limit applies:
+    once its deadline passes, its queries are interrupted and _TimedOut is
+    raised in the thread. Same interface as SupervisedRun.
+    """
+
+    def __init__(self, func, global_env):
+        self.name = func.__name__
+        self._func = func
+        self._global_env = global_env
+        self.fd, self._wake_fd = os.pipe()
+        self.deadline = time.monotonic() + FUNCTION_TIMEOUT if FUNCTION_TIMEOUT else None
+        self.done = False
+        self.timed_out = False
+        self._finished = False
+        self._lock = threading.Lock()
+        self._outcome = None
+        self._thread = threading.Thread(target=in_context(self._run), name=self.name, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            try:
+                with span(self.name, "function"):
+                    outcome = ("ok", self._func())
+            except Exception as e:
+                outcome = ("error", e)
+            with self._lock:
+                self._finished = True
+            self._outcome = outcome
+        except _TimedOut:
+            pass  # kill() has recorded the timeout
+        finally:
+            try:
+                os.write(self._wake_fd, b"x")
+            except OSError:
+                pass  # the supervisor stopped waiting for it
+            os.close(self._wake_fd)
+
+    def fileno(self):
+        return self.fd
+
+    def read(self):
+        os.read(self.fd, 1)
+        self.done = True
+
+    def kill(self):
+        with self._lock:
+            if self._finished:
+                return
+            self.timed_out = self.done = True
+            db = self._global_env.get("db")
+            if isinstance(db, DatabasePool):
+                db.interrupt()
+            ctypes.pythonapi.PyThreadState_SetAsyncExc(ctypes.c_ulong(self._thread.ident), ctypes.py_object(_TimedOut))
+
+    def result(self, global_env):
+        """Return the function's result; raises what it raised, or FunctionLimitError if it timed out."""
+        # A blocking call (a sleep, say) delays the exception; give it a moment.
+        self._thread.join(0.1 if self.timed_out else None)
+        os.close(self.fd)
+        if self.timed_out:
+            if self._thread.is_alive():
+                report(f"Warning: {self.name} is still running after its timeout and is left in the background",
+                       stream=sys.stderr)
+            raise FunctionLimitError(f"{self.name} timed out after {FUNCTION_TIMEOUT:g}s")
+        kind, value = self._outcome
+        if kind == "error":
+            raise value
+        return value
+
+
+def skip_function(name, failed_dependency, global_env):
+    report(f"Skipping {name}: {failed_dependency} failed")
+    global_env[f"{name}_error"] = f"skipped because {failed_dependency} failed"
+
+
+def _written_state(global_env, writes):
+    """{(container, key): value} for the writes that exist; container is global_env or a dict in it."""
+    state = {}
+    for container, key in writes:
+        target = global_env if container == "global_env" else global_env.get(container, {})
+        if key in target:
+            state[(container, key)] = target[key]
+    return state
+
+
+def _restore(name, global_env, checkpoints, checkpoint_key, writes):
+    """Restore name's result and writes from a usable checkpoint when resuming; returns whether it did."""
+    if checkpoints is None or not checkpoint_key or not RESUME:
+        return False
+    found, result, state = checkpoints.load(checkpoint_key)
+    if not found or not all(tuple(write) in state for write in writes):
+        return False
+    for (container, key), value in state.items():
+        (global_env if container == "global_env" else global_env[container])[key] = value
+    global_env[name] = result
+    report(f"Restored {name} from checkpoint")
+    return True
+
+
+def _record_result(name, result, global_env, checkpoints, checkpoint_key, writes):
+    global_env[name] = result
+    if checkpoints is not None and checkpoint_key:
+        try:
+            checkpoints.save(checkpoint_key, result, _written_state(global_env, writes))
+        except OSError as e:
+            report(f"Warning: could not checkpoint {name}: {e}")
+    if result is not None:
+        report(f"Result: {result}")
+
+
+def _record_error(name, e, global_env):
+    """Report and store the exception being handled."""
+    report(f"Error in {name}: {e}")
+    if not isinstance(e, (InvalidFunctionError, FunctionLimitError)):
+        report(traceback.format_exc().rstrip(), stream=sys.stderr)
+    global_env[f"{name}_error"] = str(e)
+    global_env[f"{name}_exception"] = e
+
+
+def run_function(func, global_env, checkpoints=None, checkpoint_key=None, writes=()):
+    """
+    Run one generated function in this process, storing its result or error
+    in global_env. writes are the (container, key) pairs it sets, where
+    container is "global_env" or a dict stored in it such as
+    "global_context"; they are checkpointed with its result.
+    Returns whether it succeeded.
+    """
+    name = func.__name__
+    if _restore(name, global_env, checkpoints, checkpoint_key, writes):
+        return True
+    report(f"Running {name}...")
+    try:
+        with span(name, "function"):
+            result = func()
+    except Exception as e:
+        _record_error(name, e, global_env)
+        return False
+    _record_result(name, result, global_env, checkpoints, checkpoint_key, writes)
+    return True
+
+
+class _Schedule:
+    """Which functions are ready to run, given what has finished so far."""
+
+    def __init__(self, functions, dependencies):
+        self.order = {func.__name__: i for i, func in enumerate(functions)}
+        self.by_name = {func.__name__: func for func in functions}
+        self.waiting_on = {
+            name: {dep for dep in dependencies.get(name, ()) if dep in self.order} for name in self.order
+        }
+        self.dependents = {name: [] for name in self.order}
+        for name, deps in self.waiting_on.items():
+            for dep in deps:
+                self.dependents[dep].append(name)
+        # Ready functions start in document order.
+        self.ready = [(self.order[name], name) for name, deps in self.waiting_on.items() if not deps]
+        heapq.heapify(self.ready)
+
+    def pop(self):
+        return self.by_name[heapq.heappop(self.ready)[1]]
+
+    def finished(self, finished):
+        for name in self.dependents[finished]:
+            self.waiting_on[name].discard(finished)
+            if not self.waiting_on[name]:
+                heapq.heappush(self.ready, (self.order[name], name))
+
+
+def run_functions(functions, dependencies, global_env, max_workers=None, checkpoint_keys=None, checkpoint_writes=None):
+    """
+    Run the generated functions, starting each one as soon as every function
+    it depends on has finished. dependencies maps a function name to the names
+    it must wait for. Independent functions run concurrently on a thread pool;
+    with max_workers=1 (or NATURE_MAX_WORKERS=1) they run one at a time in
+    document order. With per-function limits set, functions run in forked
+    children instead (see _run_supervised).
+    checkpoint_keys maps function names to checkpoint keys; successful results
+    are saved under them, and restored instead of re-run when resuming.
+    checkpoint_writes maps function names to the (container, key) pairs they
+    set in global_env or global_context, saved and restored with their results.
+    A function whose dependency failed (or was skipped) is skipped.
+    """
+    max_workers = max_workers or default_max_workers()
+    checkpoint_keys = checkpoint_keys or {}
+    checkpoint_writes = checkpoint_writes or {}
+    checkpoints = None
+    if checkpoint_keys and (CHECKPOINTS_ENABLED or RESUME):
+        checkpoints = CheckpointStore()
+        checkpoints.evict()
+    failed = set()
+
+    def blocked(name):
+        failed_deps = [dep for dep in dependencies.get(name, ()) if dep in failed]
+        if failed_deps:
+            skip_function(name, failed_deps[0], global_env)
+            failed.add(name)
+        return bool(failed_deps)
+
+    @in_context
+    def run(func):
+        name = func.__name__
+        if not blocked(name) and not run_function(
+                func, global_env, checkpoints, checkpoint_keys.get(name), checkpoint_writes.get(name, ())):
+            failed.add(name)
+
+    if limits_enabled():
+        _run_supervised(_Schedule(functions, dependencies), global_env, max_workers, failed, blocked,
+                        checkpoints, checkpoint_keys, checkpoint_writes)
+        return
+
+    if max_workers <= 1 or len(functions) <= 1:
+        for func in functions:
+            run(func)
+        return
+
+    schedule = _Schedule(functions, dependencies)
+    running = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while schedule.ready or running:
+            while schedule.ready:
+                func = schedule.pop()
+                running[executor.submit(run, func)] = func.__name__
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                schedule.finished(running.pop(future))
+
+
+def _run_supervised(schedule, global_env, max_workers, failed, blocked, checkpoints, checkpoint_keys, checkpoint_writes):
+    """
+    run_functions under per-function limits. Every child is forked from this
+    one thread, which then relays their output and enforces their deadlines,
+    so no other runtime thread can be holding a lock when a child is forked.
+    Functions using `db` run on threads of this process instead (see
+    ThreadedRun), under the timeout only.
+    """
+    running = []
+    while schedule.ready or running:
+        while schedule.ready and len(running) < max_workers:
+            func = schedule.pop()
+            name = func.__name__
+            key, writes = checkpoint_keys.get(name), checkpoint_writes.get(name, ())
+            if blocked(name) or _restore(name, global_env, checkpoints, key, writes):
+                schedule.finished(name)
+                continue
+            report(f"Running {name}...")
+            if uses_database(func):
+                if FUNCTION_CPU_LIMIT or FUNCTION_MEMORY_LIMIT:
+                    report(f"Warning: {name} uses db, so it runs in-process without CPU or memory limits",
+                           stream=sys.stderr)
+                running.append(ThreadedRun(func, global_env))
+            else:
+                running.append(SupervisedRun(func, global_env, [run.fd for run in running]))
+        if not running:
+            continue
+
+        deadlines = [run.deadline for run in running if run.deadline is not None]
+        timeout = max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+        for run in select.select(running, [], [], timeout)[0]:
+            run.read()
+        now = time.monotonic()
+        for run in running:
+            if not run.done and run.deadline is not None and now >= run.deadline:
+                run.kill()
+
+        for run in [run for run in running if run.done]:
+            running.remove(run)
+            key, writes = checkpoint_keys.get(run.name), checkpoint_writes.get(run.name, ())
+            try:
+                result = run.result(global_env)
+            except Exception as e:
+                _record_error(run.name, e, global_env)
+                failed.add(run.name)
+            else:
+                _record_result(run.name, result, global_env, checkpoints, key, writes)
+            schedule.finished(run.name)
@@ -0,0 +1,232 @@
+# language/templates.py
+import ast
+import hashlib
+import io
+import json
+import re
+import textwrap
+import threading
+import tokenize
+from contextlib import contextmanager
+from . import config
+from .cache import get_cache, normalize_instructions
+from .rewriter import clean_body
+
+# Literals in instructions that become template parameters: quoted strings and
+# numbers (a leading currency sign stays in the template). Numbers naming
+# another function ("function 2", function_2) are structural and stay put.
+INSTRUCTION_LITERAL = re.compile(
+    r'"(?P<double>[^"\\\n]*)"'
+    r"|(?<!\w)'(?P<single>[^'\\\n]*)'(?!\w)"
+    r"|(?<![\w.])(?<!function )(?P<number>\d+(?:\.\d+)?)(?!\w|\.\d)",
+    re.IGNORECASE,
+)
+# Characters that can't be dropped into a literal of the cached code without escaping.
+UNSAFE_STRING = re.compile(r"""['"\\\n{}]""")
+
+
+def extract_template(instructions):
+    """
+    Split instructions into a template and its literal parameters, e.g.
+    'add a book called "Dune" for $9.99' -> ('add a book called "<s>" for $<n>',
+    [("s", "Dune"), ("n", "9.99")]).
+    """
+    params = []
+
+    def replace(match):
+        if match.group("number") is not None:
+            params.append(("n", match.group("number")))
+            return "<n>"
+        quote = '"' if match.group("double") is not None else "'"
+        params.append(("s", match.group("double") if quote == '"' else match.group("single")))
+        return f"{quote}<s>{quote}"
+
+    template = INSTRUCTION_LITERAL.sub(replace, normalize_instructions(instructions))
+    return template, params
+
+
+def _literal_ranges(code):
+    """Character ranges of the string and number tokens in code, or None if it doesn't tokenize."""
+    line_starts = [0] + [m.end() for m in re.finditer("\n", code)]
+    strings, numbers = [], []
+    try:
+        for tok in tokenize.generate_tokens(io.StringIO(code).readline):
+            if tok.type == tokenize.NUMBER:
+                target = numbers
+            elif tok.type == tokenize.STRING or tokenize.tok_name[tok.type].startswith("FSTRING"):
+                target = strings
+            else:
+                continue
+            target.append((line_starts[tok.start[0] - 1] + tok.start[1], line_starts[tok.end[0] - 1] + tok.end[1]))
+    except (tokenize.TokenError, IndentationError, SyntaxError):
+        return None
+    return strings, numbers
+
+
+def _within(ranges, start, end, exact=False):
+    if exact:
+        return (start, end) in ranges
+    return any(low <= start and end <= high for low, high in ranges)
+
+
+def build_code_template(code, params):
+    """
+    Turn generated code into a list of text segments and parameter indexes by
+    locating each parameter's literal inside the code's string and number
+    literals. Returns None when that can't be done unambiguously: a parameter
+    that doesn't appear verbatim (the model may have derived something from
+    it), or two parameters claiming the same text.
+    """
+    ranges = _literal_ranges(code)
+    if ranges is None:
+        return None
+    strings, numbers = ranges
+    spans = []
+    for index, (kind, text) in enumerate(params):
+        if not text:
+            return None
+        head = r"(?<![\w.])" if kind == "n" else (r"(?<!\w)" if text[0].isalnum() or text[0] == "_" else "")
+        tail = r"(?!\w|\.\d)" if kind == "n" else (r"(?!\w)" if text[-1].isalnum() or text[-1] == "_" else "")
+        found = [
+            match.span()
+            for match in re.finditer(head + re.escape(text) + tail, code)
+            if _within(strings, *match.span()) or (kind == "n" and _within(numbers, *match.span(), exact=True))
+        ]
+        if not found:
+            return None
+        spans.extend((start, end, index) for start, end in found)
+
+    spans.sort()
+    segments, position = [], 0
+    for start, end, index in spans:
+        if start < position:
+            return None
+        segments.extend([code[position:start], index])
+        position = end
+    segments.append(code[position:])
+    return segments
+
+
+def fill_code_template(segments, params):
+    return "".join(params[part][1] if isinstance(part, int) else part for part in segments)
+
+
+def is_valid_body(code):
+    """Whether code parses as the body of a function."""
+    try:
+        ast.parse("def _body():\n" + textwrap.indent(code, "    ") + "\n    pass\n")
+    except SyntaxError:
+        return False
+    return True
+
+
+class TemplateCache:
+    """
+    Generated code keyed by instruction template rather than exact text, so
+    instructions that differ only in their literals reuse one generation with
+    the new literals substituted. Templates are kept in memory and, when the
+    generation cache is enabled, on disk alongside it.
+    While one function's template is claimed (being generated and validated),
+    others with the same template wait for it instead of issuing their own
+    request.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._memory = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def key(self, template):
+        payload = "\0".join([
+            "template", template, config.MODEL, repr(config.GENERATION_TEMPERATURE), str(config.PROMPT_VERSION),
+        ])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _load(self, key):
+        if key in self._memory:
+            return self._memory[key]
+        cache = get_cache()
+        stored = cache.get(key) if cache is not None else None
+        if stored is None:
+            return None
+        segments = json.loads(stored)
+        self._memory[key] = segments
+        return segments
+
+    def _fill(self, segments, params):
+        if segments is None or any(kind == "s" and UNSAFE_STRING.search(text) for kind, text in params):
+            return None
+        code = fill_code_template(segments, params)
+        return code if is_valid_body(code) else None
+
+    def lookup(self, instructions):
+        """Code for instructions from a known template, or None."""
+        template, params = extract_template(instructions)
+        if not params:
+            return None
+        code = self._fill(self._load(self.key(template)), params)
+        with self._lock:
+            if code is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return code
+
+    def store(self, instructions, code):
+        """Remember code generated for instructions as the code for their template."""
+        template, params = extract_template(instructions)
+        if not params or code.startswith("# Error"):
+            return
+        code = clean_body(code)
+        if not is_valid_body(code):
+            return
+        segments = build_code_template(code, params)
+        if segments is None:
+            return
+        key = self.key(template)
+        self._memory[key] = segments
+        cache = get_cache()
+        if cache is not None:
+            cache.put(key, json.dumps(segments))
+
+    @contextmanager
+    def claim(self, instructions):
+        """
+        Hold the template of instructions while their code is generated and
+        validated. A caller whose template is already held waits for it to be
+        released first, so its lookup sees the code stored by the holder.
+        """
+        template, params = extract_template(instructions)
+        if not params:
+            yield
+            return
+        key = self.key(template)
+        with self._lock:
+            pending = self._pending.get(key)
+            if pending is None:
+                self._pending[key] = threading.Event()
+        if pending is not None:
+            # If the holder stored nothing usable, the caller's lookup misses
+            # and it makes a request of its own.
+            pending.wait()
+            yield
+            return
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._pending.pop(key).set()
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "templates": len(self._memory)}
+
+
+template_cache = TemplateCache()
@@ -1,5 +1,8 @@
 # language/utils.py
+import io
+import mmap
 from .ast import FunctionDefinition
+from .profiler import traced
 
 def load_nature_file(file_path):
     """Reads a .nature file and returns its content."""
@@ -10,45 +13,81 @@ def load_nature_file(file_path):
         print(f"Error reading file {file_path}: {e}")
         return ""
 
-def parse_nature_document(document_text):
+def iter_nature_functions(lines):
     """
-    Parse a complete document into separate function definitions.
-    Functions start with a line that begins with "function:".
-    Everything following that line (until the next "function:" or end-of-file) 
-    is part of that function.
+    Incrementally parse a document into function definitions.
+    lines may be any iterable of str or bytes lines: a text or binary file
+    object, a memory map's readline iterator, or a list. Each FunctionDefinition
+    is yielded as soon as its block closes (at the next "function:" line or at
+    the end of input) and records its line and byte span in the source.
     """
-    functions = []
     current_function_lines = []
     current_function_name = None
     func_counter = 0
+    start_line = start_byte = end_line = end_byte = None
+    offset = 0
+
+    def finish():
+        return FunctionDefinition(
+            name=current_function_name,
+            instructions="\n".join(current_function_lines).strip(),
+            generated_code=None,  # Will be set later
+            start_line=start_line,
+            end_line=end_line,
+            start_byte=start_byte,
+            end_byte=end_byte,
+        )
+
+    for line_number, line in enumerate(lines, start=1):
+        if isinstance(line, bytes):
+            line_bytes = len(line)
+            line = line.decode("utf-8")
+        else:
+            line_bytes = len(line.encode("utf-8"))
+        line_start = offset
+        offset += line_bytes
 
-    lines = document_text.splitlines()
-    for line in lines:
         line_strip = line.strip()
         if line_strip.lower().startswith("function:"):
             if current_function_lines and current_function_name:
-                instructions = "\n".join(current_function_lines).strip()
-                functions.append(FunctionDefinition(
-                    name=current_function_name,
-                    instructions=instructions,
-                    generated_code=None  # Will be set later
-                ))
+                yield finish()
             func_counter += 1
             current_function_name = f"function_{func_counter}"
+            start_line, start_byte = line_number, line_start
+            end_line, end_byte = line_number, offset
             # Optionally capture extra text after "function:".
             extra = line_strip[9:].strip()
             current_function_lines = [extra] if extra else []
-        else:
-            if line_strip:
-                current_function_lines.append(line_strip)
-    
+        elif line_strip:
+            current_function_lines.append(line_strip)
+            end_line, end_byte = line_number, offset
+
     # Handle the last function
     if current_function_lines and current_function_name:
-        instructions = "\n".join(current_function_lines).strip()
-        functions.append(FunctionDefinition(
-            name=current_function_name,
-            instructions=instructions,
-            generated_code=None  # Will be set later
-        ))
-    
-    return functions
+        yield finish()
+
+def iter_nature_file(file_path, use_mmap=True):
+    """
+    Stream the function definitions of a .nature file, reading it through a
+    memory map when possible so large documents are never loaded as one string.
+    """
+    with open(file_path, "rb") as f:
+        if use_mmap:
+            try:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    yield from iter_nature_functions(iter(mapped.readline, b""))
+                return
+            except ValueError:
+                # Empty files cannot be mapped; fall through to plain reads.
+                pass
+        yield from iter_nature_functions(f)
+
+@traced("parse")
+def parse_nature_document(document_text):
+    """
+    Parse a complete document into separate function definitions.
+    Functions start with a line that begins with "function:".
+    Everything following that line (until the next "function:" or end-of-file) 
+    is part of that function.
+    """
+    return list(iter_nature_functions(io.StringIO(document_text)))
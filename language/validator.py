@@ -0,0 +1,117 @@
+# language/validator.py
+"""
+Checks generated function bodies before they are assembled into a program:
+each body is rendered exactly as generate_document_code would render it,
+then parsed, compiled and scanned for names that nothing defines. Bodies
+that fail are re-prompted (see parser._ensure_valid) and, if they never
+pass, replaced by a stub that raises InvalidFunctionError when run.
+"""
+import ast
+import builtins
+import functools
+import importlib.util
+import re
+import symtable
+from .rewriter import FunctionBody
+
+FUNCTION_NAME = re.compile(r"^function_(\d+)$")
+
+# Names the generated program defines at module level (see generate_document_code).
+PROGRAM_GLOBALS = {
+    "sys", "DatabasePool", "ModuleManager", "run_functions",
+    "module_manager", "global_env", "db", "global_context",
+    "DEPENDENCIES", "CHECKPOINT_KEYS",
+}
+KNOWN_NAMES = PROGRAM_GLOBALS | set(dir(builtins)) | {"__name__", "__file__", "__builtins__"}
+
+INVALID_STUB_MARKER = "# Error: generated code is invalid"
+
+
+def function_index(name):
+    """0-based document position encoded in a function_N name (0 for anything else)."""
+    match = FUNCTION_NAME.match(name)
+    return int(match.group(1)) - 1 if match else 0
+
+
+@functools.lru_cache(maxsize=None)
+def _importable(name):
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+def undefined_names(source):
+    """
+    Names read in source's functions that are neither assigned in them nor
+    declared global: the names that must come from the program's globals.
+    """
+    names = set()
+
+    def visit(table):
+        for symbol in table.get_symbols():
+            if symbol.is_referenced() and symbol.is_global() and not symbol.is_declared_global():
+                names.add(symbol.get_name())
+        for child in table.get_children():
+            visit(child)
+
+    for child in symtable.symtable(source, "<generated>", "exec").get_children():
+        visit(child)
+    return names
+
+
+def implicit_imports(name, body, index, module_names):
+    """
+    Importable modules that the function at index uses as `module.attr`
+    although no function imports them (module_names). Validation accepts
+    these, so generate_document_code imports them for the function.
+    """
+    candidates = {
+        n for n in body.attribute_bases
+        if n not in module_names and n not in KNOWN_NAMES and _importable(n)
+    }
+    if not candidates:
+        return set()
+    from .code_generator import function_definition, render_body
+
+    source = function_definition(name, render_body(body, index, module_names))
+    try:
+        return candidates & undefined_names(source)
+    except SyntaxError:
+        return set()
+
+
+def validate_function_code(name, code):
+    """
+    Return None if the body of function name is valid, otherwise a short
+    description of the problem suitable for a repair prompt. Names of
+    functions and of anything the program defines globally are accepted, as
+    is an importable module used as `module.attr`: the program imports it
+    (see implicit_imports). A module used any other way must be imported.
+    """
+    from .code_generator import function_definition, render_body
+
+    body = FunctionBody(code)
+    source = function_definition(name, render_body(body, function_index(name), body.imports))
+    try:
+        compile(ast.parse(source, f"<{name}>"), f"<{name}>", "exec")
+    except SyntaxError as e:
+        line = (e.text or "").strip()
+        return f"{type(e).__name__}: {e.msg}" + (f" at `{line}`" if line else "")
+    unknown = sorted(
+        n for n in undefined_names(source)
+        if n not in KNOWN_NAMES and not FUNCTION_NAME.match(n)
+        and not (n in body.attribute_bases and _importable(n))
+    )
+    if unknown:
+        return f"NameError: {', '.join(repr(n) for n in unknown)} not defined (never assigned, imported or passed in)"
+    return None
+
+
+def invalid_function_stub(name, error):
+    """A body that fails fast, in place of code that never validated."""
+    return (
+        f"{INVALID_STUB_MARKER}\n"
+        "from language.runtime import InvalidFunctionError\n"
+        f"raise InvalidFunctionError({f'{name} has no valid code: {error}'!r})"
+    )
@@ -1,7 +1,8 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify
+import json
 import os
 import sys
-import traceback
+import threading
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -15,7 +16,10 @@ if project_root not in sys.path:
 try:
     from language.utils import parse_nature_document
     from language.code_generator import generate_document_code
-    from language.parser import llm_generate_function_code
+    from language.parser import generate_functions
+    from language.profiler import profiling, span
+    from worker_pool import WorkerPool
+    from jobs import DONE, FAILED, JobQueue, QueueFull
 except ImportError as e:
     print(f"Error importing language modules: {e}")
     print("Please ensure all dependencies are installed:")
@@ -24,86 +28,169 @@ except ImportError as e:
 
 app = Flask(__name__)
 
+# Generated programs run in a pool of pre-warmed worker processes rather than in
+# the Flask process, so concurrent requests don't share stdout or block each other.
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = WorkerPool(
+                size=int(os.getenv('NATURE_SANDBOX_WORKERS', 0)) or None,
+                max_jobs_per_worker=int(os.getenv('NATURE_SANDBOX_MAX_JOBS', 50)),
+                timeout=float(os.getenv('NATURE_SANDBOX_TIMEOUT', 30)),
+            )
+        return _pool
+
 @app.route('/')
 def index():
     return render_template('index.html')
 
-@app.route('/compile', methods=['POST'])
-def compile_code():
-    try:
-        # Get the code from the request
-        data = request.get_json()
-        if not data or 'code' not in data:
-            return jsonify({'error': 'No code provided'}), 400
-        
-        code = data['code']
-        
-        # Validate that code is not empty or None
-        if not code or not isinstance(code, str):
-            return jsonify({'error': 'Invalid code: must be a non-empty string'}), 400
-        
-        # Parse the document into functions
-        functions = parse_nature_document(code)
+def run_in_pool(python_code, profiler, on_output=None):
+    """Run the program in a worker, merging the worker's function timings into profiler."""
+    with span('run', 'exec'):
+        result = get_pool().run(python_code, on_output=on_output, profile=True)
+    profiler.extend(result['events'])
+    return result
+
+def profile_payload(profiler):
+    return {'summary': profiler.summary(), 'trace': profiler.chrome_trace()}
+
+def sse_event(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+def run_job(job):
+    """
+    Parse, generate and run a job's document, emitting progress events on it:
+    'parsed', one 'generated' per function, 'code', 'output' chunks while the
+    program runs, and finally 'result' or 'error'. Returns (status, result).
+    """
+    with profiling() as profiler:
+        functions = parse_nature_document(job.code)
         if not functions:
-            return jsonify({'error': 'No valid functions found in the code. Make sure to use "function:" to start each function block.'}), 400
-        
-        # Generate code for each function using the LLM
+            return fail(job, 'No valid functions found in the code. Make sure to use "function:" to start each function block.')
+        job.emit('parsed', {'functions': [{'name': f.name, 'instructions': f.instructions} for f in functions]})
+
+        generate_functions(
+            functions,
+            use_cache=not job.options.get('no_cache', False),
+            on_generated=lambda f: job.emit('generated', {'name': f.name, 'code': f.generated_code}),
+        )
         for func in functions:
-            func.generated_code = llm_generate_function_code(func.instructions)
             if not func.generated_code or func.generated_code.startswith("# Error"):
-                return jsonify({'error': f'Failed to generate code for function {func.name}'}), 400
-        
-        # Generate the final Python code
+                return fail(job, f'Failed to generate code for function {func.name}')
+
         python_code = generate_document_code(functions)
-        
-        # Create a dictionary to capture output
-        output_data = {'stdout': '', 'stderr': ''}
-        
-        # Custom stdout/stderr redirector
-        class OutputRedirector:
-            def __init__(self, output_dict, stream_name):
-                self.output_dict = output_dict
-                self.stream_name = stream_name
-                
-            def write(self, text):
-                self.output_dict[self.stream_name] += text
-                
-            def flush(self):
-                pass
-        
-        # Save original stdout/stderr
-        original_stdout = sys.stdout
-        original_stderr = sys.stderr
-        
-        # Redirect stdout/stderr
-        sys.stdout = OutputRedirector(output_data, 'stdout')
-        sys.stderr = OutputRedirector(output_data, 'stderr')
-        
-        try:
-            # Execute the generated code
-            exec(python_code, globals())
-            success = True
-        except Exception as e:
-            output_data['stderr'] += f"Execution error: {str(e)}\n"
-            success = False
-        finally:
-            # Restore stdout/stderr
-            sys.stdout = original_stdout
-            sys.stderr = original_stderr
-        
-        return jsonify({
-            'success': success,
+        job.emit('code', {'code': python_code})
+
+        result = run_in_pool(
+            python_code,
+            profiler,
+            on_output=lambda stream, text: job.emit('output', {'stream': stream, 'text': text}),
+        )
+        payload = {
+            'success': result['success'],
+            'timed_out': result['timed_out'],
             'generated_code': python_code,
-            'output': output_data['stdout'],
-            'error': output_data['stderr']
-        })
-        
-    except Exception as e:
-        print(f"Unexpected error: {e}")
-        traceback.print_exc()
-        return jsonify({
-            'error': f'Unexpected error: {str(e)}'
-        }), 500
+            'output': result['stdout'],
+            'error': result['stderr'],
+            'profile': profile_payload(profiler),
+        }
+        job.emit('result', payload)
+        return DONE, payload
+
+def fail(job, message):
+    payload = {'error': message}
+    job.emit('error', payload)
+    return FAILED, payload
+
+# Compiles are queued and served by a few worker threads; identical documents
+# submitted while one is in flight share its job.
+_jobs = None
+_jobs_lock = threading.Lock()
+
+def get_jobs():
+    global _jobs
+    with _jobs_lock:
+        if _jobs is None:
+            _jobs = JobQueue(
+                run_job,
+                workers=int(os.getenv('NATURE_SANDBOX_JOB_WORKERS', 4)),
+                max_queued=int(os.getenv('NATURE_SANDBOX_MAX_QUEUED', 32)),
+                retention=float(os.getenv('NATURE_SANDBOX_JOB_RETENTION', 600)),
+            )
+        return _jobs
+
+def submit_job():
+    """Validate the request body and queue it. Returns (job, attached, None) or (None, None, error response)."""
+    data = request.get_json(silent=True)
+    if not data or 'code' not in data:
+        return None, None, (jsonify({'error': 'No code provided'}), 400)
+    code = data['code']
+    # Validate that code is not empty or None
+    if not code or not isinstance(code, str):
+        return None, None, (jsonify({'error': 'Invalid code: must be a non-empty string'}), 400)
+    try:
+        job, attached = get_jobs().submit(code, {'no_cache': bool(data.get('no_cache', False))})
+    except QueueFull as e:
+        response = jsonify({'error': f'Server busy: {e}. Try again shortly.'})
+        response.headers['Retry-After'] = '5'
+        return None, None, (response, 429)
+    return job, attached, None
+
+def stream_job(job):
+    """Server-sent events for a job, replaying the ones that already happened."""
+    def stream():
+        for event, payload in job.follow():
+            yield sse_event(event, payload)
+    return Response(stream(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    """Queue a document; returns the job id to poll (GET /jobs/<id>) or follow (GET /jobs/<id>/events)."""
+    job, attached, error = submit_job()
+    if error:
+        return error
+    return jsonify({'job_id': job.id, 'status': job.status, 'attached': attached}), 202
+
+@app.route('/jobs', methods=['GET'])
+def queue_stats():
+    return jsonify(get_jobs().stats())
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = get_jobs().get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(job.describe())
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    job = get_jobs().get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return stream_job(job)
+
+@app.route('/compile', methods=['POST'])
+def compile_code():
+    """Queue the document and wait for its result."""
+    job, _, error = submit_job()
+    if error:
+        return error
+    job.wait()
+    if job.status == FAILED:
+        return jsonify(job.result), 500 if job.exception else 400
+    return jsonify(job.result)
+
+@app.route('/compile/stream', methods=['POST'])
+def compile_stream():
+    """Like /compile, but streams the job's progress as server-sent events."""
+    job, _, error = submit_job()
+    if error:
+        return error
+    return stream_job(job)
 
 if __name__ == '__main__':
     # Check for required environment variables
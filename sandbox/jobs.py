@@ -0,0 +1,164 @@
+import hashlib
+import json
+import queue
+import threading
+import time
+import traceback
+import uuid
+
+# Job states. A job is finished once it is DONE or FAILED.
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+class QueueFull(Exception):
+    """Raised by JobQueue.submit when the queue is at capacity."""
+
+
+class Job:
+    """
+    One compile-and-run of a document. Progress is recorded as an append-only
+    list of (event, payload) pairs, so any number of clients can follow it,
+    including ones that attach after it started.
+    """
+
+    def __init__(self, key, code, options):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.code = code
+        self.options = options
+        self.status = QUEUED
+        self.events = []
+        self.result = None
+        self.exception = None
+        self.created = time.time()
+        self.finished = None
+        self._condition = threading.Condition()
+
+    @property
+    def done(self):
+        return self.status in (DONE, FAILED)
+
+    def emit(self, event, payload):
+        with self._condition:
+            self.events.append((event, payload))
+            self._condition.notify_all()
+
+    def finish(self, status, result):
+        with self._condition:
+            self.status = status
+            self.result = result
+            self.finished = time.time()
+            self._condition.notify_all()
+
+    def wait(self, timeout=None):
+        with self._condition:
+            self._condition.wait_for(lambda: self.done, timeout)
+        return self.done
+
+    def follow(self, start=0):
+        """Yield every event from index start on, blocking for new ones until the job finishes."""
+        position = start
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: len(self.events) > position or self.done)
+                pending = self.events[position:]
+                finished = self.done
+            yield from pending
+            position += len(pending)
+            if finished and position == len(self.events):
+                return
+
+    def describe(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "created": self.created,
+            "finished": self.finished,
+            "result": self.result,
+        }
+
+
+def document_key(code, options):
+    """Identical documents with identical options share a job while one is in flight."""
+    payload = json.dumps({"code": code, "options": options}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class JobQueue:
+    """
+    A bounded queue of jobs served by a fixed number of worker threads.
+    run(job) does the work, emitting progress on the job, and returns
+    (status, result). Submitting a document identical to one that is queued
+    or running returns that job instead of creating another. Finished jobs
+    stay available for retention seconds.
+    """
+
+    def __init__(self, run, workers=2, max_queued=16, retention=600):
+        self.run = run
+        self.retention = retention
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._jobs = {}
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._threads = [
+            threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, code, options=None):
+        """
+        Queue a job for code and return (job, attached), where attached is True
+        when an identical in-flight job was returned instead of a new one.
+        Raises QueueFull when no more jobs can be accepted.
+        """
+        options = options or {}
+        key = document_key(code, options)
+        with self._lock:
+            self._expire()
+            existing = self._in_flight.get(key)
+            if existing is not None:
+                return existing, True
+            job = Job(key, code, options)
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                raise QueueFull(f"{self._queue.maxsize} jobs already queued") from None
+            self._jobs[job.id] = job
+            self._in_flight[key] = job
+        return job, False
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "queued": self._queue.qsize(),
+                "capacity": self._queue.maxsize,
+                "in_flight": len(self._in_flight),
+                "retained": len(self._jobs),
+            }
+
+    def _expire(self):
+        cutoff = time.time() - self.retention
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.done and job.finished < cutoff]:
+            del self._jobs[job_id]
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            job.status = RUNNING
+            try:
+                status, result = self.run(job)
+            except Exception as e:
+                traceback.print_exc()
+                job.exception = e
+                status, result = FAILED, {"error": f"Unexpected error: {str(e)}"}
+                job.emit("error", result)
+            with self._lock:
+                if self._in_flight.get(job.key) is job:
+                    del self._in_flight[job.key]
+            job.finish(status, result)
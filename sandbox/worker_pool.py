@@ -0,0 +1,193 @@
+import importlib
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
+import traceback
+from contextlib import redirect_stderr, redirect_stdout
+
+# Imported once per worker so generated programs don't pay for them on every run.
+PRELOAD_MODULES = (
+    "sqlite3", "json", "math", "random", "re", "datetime",
+    "collections", "itertools", "csv", "statistics", "traceback",
+)
+
+
+class _PipeWriter:
+    """
+    File-like object that forwards everything written to it over the worker
+    pipe. Generated functions print from several threads, so every send on
+    the connection holds lock.
+    """
+
+    def __init__(self, conn, stream_name, lock):
+        self.conn = conn
+        self.stream_name = stream_name
+        self.lock = lock
+
+    def write(self, text):
+        if text:
+            with self.lock:
+                self.conn.send(("output", self.stream_name, text))
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+def _execute(code):
+    try:
+        exec(code, {"__name__": "__main__"})
+        return True
+    except BaseException as e:
+        print(f"Execution error: {e}", file=sys.stderr)
+        traceback.print_exc()
+        return False
+
+
+def _worker_main(conn, preload):
+    for name in preload:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            pass
+
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            break
+        if job is None:
+            break
+        code, profile = job
+        lock = threading.Lock()
+
+        success = True
+        events = []
+        with redirect_stdout(_PipeWriter(conn, "stdout", lock)), redirect_stderr(_PipeWriter(conn, "stderr", lock)):
+            if profile:
+                from language.profiler import profiling
+                with profiling() as profiler:
+                    success = _execute(code)
+                events = profiler.events
+            else:
+                success = _execute(code)
+        with lock:
+            conn.send(("done", success, events))
+
+
+class _Worker:
+    def __init__(self, ctx, preload):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn, preload), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.jobs_done = 0
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout=1)
+        self.kill()
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+class WorkerPool:
+    """
+    A fixed-size pool of pre-warmed Python processes that execute generated
+    programs. Output is streamed back over a pipe per worker. A worker is
+    replaced after max_jobs_per_worker jobs, when it dies, or when a job
+    exceeds its timeout.
+    """
+
+    def __init__(self, size=None, max_jobs_per_worker=50, timeout=30.0, preload=PRELOAD_MODULES):
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        self._ctx = multiprocessing.get_context(method)
+        self.size = size or os.cpu_count() or 1
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.timeout = timeout
+        self.preload = tuple(preload)
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        for _ in range(self.size):
+            self._idle.put(_Worker(self._ctx, self.preload))
+
+    def run(self, code, on_output=None, timeout=None, profile=False):
+        """
+        Execute code as a main program in a worker, blocking until a worker is
+        free. on_output(stream_name, text) is called as output arrives.
+        Returns a dict with success, stdout, stderr and timed_out, plus the
+        worker's profiler events under "events" when profile is set.
+        """
+        if self._closed:
+            raise RuntimeError("WorkerPool is shut down")
+        timeout = self.timeout if timeout is None else timeout
+        output = {"stdout": [], "stderr": []}
+        result = {"success": False, "timed_out": False, "events": []}
+
+        worker = self._idle.get()
+        healthy = True
+        try:
+            worker.conn.send((code, profile))
+            deadline = time.monotonic() + timeout
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not worker.conn.poll(remaining):
+                    result["timed_out"] = True
+                    output["stderr"].append(f"Execution timed out after {timeout:g} seconds\n")
+                    healthy = False
+                    break
+                message = worker.conn.recv()
+                if message[0] == "output":
+                    _, stream_name, text = message
+                    output[stream_name].append(text)
+                    if on_output is not None:
+                        on_output(stream_name, text)
+                else:
+                    _, result["success"], result["events"] = message
+                    break
+        except (EOFError, OSError) as e:
+            output["stderr"].append(f"Worker process exited unexpectedly: {e}\n")
+            healthy = False
+        except BaseException:
+            # The job may still be running; don't hand this worker to anyone else.
+            healthy = False
+            raise
+        finally:
+            worker.jobs_done += 1
+            self._release(worker, healthy)
+
+        result["stdout"] = "".join(output["stdout"])
+        result["stderr"] = "".join(output["stderr"])
+        return result
+
+    def _release(self, worker, healthy):
+        if not healthy:
+            worker.kill()
+        elif worker.jobs_done >= self.max_jobs_per_worker:
+            worker.stop()
+        else:
+            self._idle.put(worker)
+            return
+        with self._lock:
+            if not self._closed:
+                self._idle.put(_Worker(self._ctx, self.preload))
+
+    def shutdown(self):
+        with self._lock:
+            self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().stop()
+            except queue.Empty:
+                break
@@ -1,24 +1,37 @@
 use std::env;
-use std::process::{self, Command};
+use std::error::Error;
+#[cfg(unix)]
+use std::io::{self, Read, Write};
+#[cfg(unix)]
+use std::os::unix::net::UnixStream;
+#[cfg(unix)]
+use std::path::PathBuf;
+use std::process;
 
 mod interpreter;
 mod module_manager;
 
 fn main() {
     let args: Vec<String> = env::args().collect();
+    if args.get(1).map(String::as_str) == Some("build") {
+        process::exit(build_directory(&args[2..]));
+    }
+    let resume = args.iter().skip(1).any(|arg| arg == "--resume");
+    let paths: Vec<&String> = args.iter().skip(1).filter(|arg| !arg.starts_with("--")).collect();
     
-    if args.len() != 2 {
-        eprintln!("Usage: nature <file.nature>");
+    if paths.len() != 1 {
+        eprintln!("Usage: nature [--resume] <file.nature>");
+        eprintln!("       nature build [options] <directory>");
         process::exit(1);
     }
     
-    let file_path = &args[1];
+    let file_path = paths[0];
     if !file_path.ends_with(".nature") {
         eprintln!("Error: File must have .nature extension");
         process::exit(1);
     }
     
-    match run_file(file_path) {
+    match run_file(file_path, resume) {
         Ok(_) => (),
         Err(e) => {
             eprintln!("Error: {}", e);
@@ -27,8 +40,20 @@ fn main() {
     }
 }
 
-fn run_file(file_path: &str) -> Result<(), Box<dyn std::error::Error>> {
-    // First, use Python to parse and generate code
+fn run_file(file_path: &str, resume: bool) -> Result<(), Box<dyn std::error::Error>> {
+    // Hand the file to a warm `python -m language.daemon` when one is running.
+    if let Some(result) = run_with_daemon(file_path, resume) {
+        let status = result?;
+        if status != 0 {
+            process::exit(status);
+        }
+        return Ok(());
+    }
+
+    // Load the compiled .naturec artifact next to the file when it is still
+    // valid; otherwise parse, generate and compile the document (saving a new
+    // artifact), then run it. With --resume, checkpointed results of functions
+    // that succeeded last time are reused.
     let python_script = r#"
 import os
 import sys
@@ -36,43 +61,108 @@ import sys
 # Add the current directory to Python path
 sys.path.insert(0, os.getcwd())
 
-# Import the functions we need
-from language.utils import parse_nature_document
-from language.parser import llm_generate_function_code
-from language.code_generator import generate_document_code
+from language.build import run_file
 
-# Read and process the file
-with open('{}', 'r') as f:
-    content = f.read()
+run_file('{}', resume={resume})
+"#;
+
+    let mut interpreter = interpreter::Interpreter::new();
+    let script = python_script
+        .replace("{}", file_path)
+        .replace("{resume}", if resume { "True" } else { "False" });
+    interpreter.execute(&script)?;
 
-# Parse the document
-functions = parse_nature_document(content)
+    Ok(())
+}
 
-# Generate code for each function
-for func in functions:
-    func.generated_code = llm_generate_function_code(func.instructions)
+// `nature build <directory>` compiles every .nature file under the directory
+// (see `python -m language.build --help`), streaming its output as it goes.
+fn build_directory(args: &[String]) -> i32 {
+    let status = process::Command::new("python")
+        .args(["-m", "language.build"])
+        .args(args)
+        .status();
+    match status {
+        Ok(status) => status.code().unwrap_or(1),
+        Err(e) => {
+            eprintln!("Error: {}", e);
+            1
+        }
+    }
+}
 
-# Generate the final code
-generated_code = generate_document_code(functions)
-print(generated_code)
-"#;
+#[cfg(unix)]
+fn daemon_socket() -> PathBuf {
+    if let Ok(path) = env::var("NATURE_DAEMON_SOCKET") {
+        return PathBuf::from(path);
+    }
+    let cache_dir = env::var("NATURE_CACHE_DIR").map(PathBuf::from).unwrap_or_else(|_| {
+        PathBuf::from(env::var("HOME").unwrap_or_default()).join(".cache").join("nature")
+    });
+    cache_dir.join("daemon.sock")
+}
+
+#[cfg(unix)]
+fn run_with_daemon(file_path: &str, resume: bool) -> Option<Result<i32, Box<dyn Error>>> {
+    if env::var_os("NATURE_NO_DAEMON").is_some() {
+        return None;
+    }
+    let mut stream = UnixStream::connect(daemon_socket()).ok()?;
+    Some(stream_from_daemon(&mut stream, file_path, resume))
+}
 
-    // Run Python script to get generated code
-    let output = Command::new("python")
-        .arg("-c")
-        .arg(python_script.replace("{}", file_path))
-        .output()?;
+// The daemon listens on a Unix socket; elsewhere every run starts Python directly.
+#[cfg(not(unix))]
+fn run_with_daemon(_file_path: &str, _resume: bool) -> Option<Result<i32, Box<dyn Error>>> {
+    None
+}
+
+// Send a run request and copy the daemon's output frames (a tag byte, the
+// payload length as 8 hex digits, then the payload) to stdout and stderr
+// until the exit status frame arrives.
+#[cfg(unix)]
+fn stream_from_daemon(stream: &mut UnixStream, file_path: &str, resume: bool) -> Result<i32, Box<dyn Error>> {
+    let path = std::fs::canonicalize(file_path)?;
+    let cwd = env::current_dir()?;
+    let request = format!(
+        "{{\"command\": \"run\", \"path\": {}, \"cwd\": {}, \"resume\": {}}}\n",
+        json_string(&path.to_string_lossy()),
+        json_string(&cwd.to_string_lossy()),
+        resume
+    );
+    stream.write_all(request.as_bytes())?;
 
-    if !output.status.success() {
-        let error = String::from_utf8_lossy(&output.stderr);
-        return Err(format!("Python error: {}", error).into());
+    let mut header = [0u8; 9];
+    loop {
+        if stream.read_exact(&mut header).is_err() {
+            return Err("nature daemon closed the connection".into());
+        }
+        let length = usize::from_str_radix(std::str::from_utf8(&header[1..])?, 16)?;
+        let mut payload = vec![0u8; length];
+        stream.read_exact(&mut payload)?;
+        match header[0] {
+            b'o' => {
+                io::stdout().write_all(&payload)?;
+                io::stdout().flush()?;
+            }
+            b'e' => io::stderr().write_all(&payload)?,
+            b'x' => return Ok(String::from_utf8_lossy(&payload).trim().parse().unwrap_or(1)),
+            _ => (),
+        }
     }
+}
 
-    let generated_code = String::from_utf8(output.stdout)?;
-    
-    // Now use our Rust interpreter to execute the code
-    let mut interpreter = interpreter::Interpreter::new();
-    interpreter.execute(&generated_code)?;
-    
-    Ok(())
-}
\ No newline at end of file
+#[cfg(unix)]
+fn json_string(value: &str) -> String {
+    let mut quoted = String::from("\"");
+    for c in value.chars() {
+        match c {
+            '"' => quoted.push_str("\\\""),
+            '\\' => quoted.push_str("\\\\"),
+            c if (c as u32) < 0x20 => quoted.push_str(&format!("\\u{:04x}", c as u32)),
+            c => quoted.push(c),
+        }
+    }
+    quoted.push('"');
+    quoted
+}